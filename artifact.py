@@ -0,0 +1,67 @@
+import array
+import mmap
+import os
+import sys
+import zlib
+
+
+# On-disk artifacts (see dawg.py and leaves.py) are a header followed by an array of fixed-size values:
+#   header  struct starting with the magic and format version and ending with the crc32 of the values, the
+#           fields in between are the artifact's own
+#   values  the array's items, little-endian
+class ArtifactError(Exception):
+    pass
+
+
+# write header, packed from magic, version, fields and the values' crc32, and then values (an array.array)
+# atomically to path
+def write_artifact(path, header, magic, version, fields, values):
+    if sys.byteorder != "little":
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    payload = values.tobytes()
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as file:
+        file.write(header.pack(magic, version, *fields, zlib.crc32(payload)))
+        file.write(payload)
+    os.replace(temp_path, path)
+
+
+# an artifact written by write_artifact, memory-mapped read-only. fields holds the header fields between the
+# version and the crc32; read the values with values() once they are checked. description names the kind of
+# artifact in error messages, which are raised as error.
+class MappedArtifact:
+    def __init__(self, path, header, magic, version, description, error=ArtifactError):
+        self.path = path
+        self.header = header
+        self.error = error
+        with open(path, "rb") as file:
+            try:
+                self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise error(f"{path} is empty")
+        if len(self.mmap) < header.size:
+            raise error(f"{path} is truncated")
+        file_magic, file_version, *fields, self._crc = header.unpack_from(self.mmap)
+        if file_magic != magic:
+            raise error(f"{path} is not a {description}")
+        if file_version != version:
+            raise error(f"{path} has format version {file_version}, expected {version}")
+        self.fields = fields
+
+    # the count values of the given array typecode after the header, checked against the header's crc32. On
+    # little-endian machines they are read straight from the mapping.
+    def values(self, typecode, count):
+        if len(self.mmap) != self.header.size + array.array(typecode).itemsize * count:
+            raise self.error(f"{self.path} has the wrong size")
+        payload = memoryview(self.mmap)[self.header.size:]
+        if zlib.crc32(payload) != self._crc:
+            raise self.error(f"{self.path} failed its checksum")
+
+        if sys.byteorder == "little":
+            return payload.cast(typecode)
+        values = array.array(typecode)
+        values.frombytes(payload)
+        values.byteswap()
+        return values
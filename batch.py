@@ -0,0 +1,101 @@
+import argparse
+import functools
+import json
+import multiprocessing
+import sys
+import time
+
+from dawg import ensure_artifact, init_worker, worker_root
+from leaves import load_leaves
+from session import GameSession, parse_tests_file, parse_test_cases
+
+
+# the leave table of this worker process, mapped once when the worker starts
+_worker_leave_values = None
+
+
+def _init_worker(artifact_path, leaves_path):
+    global _worker_leave_values
+    init_worker(artifact_path)
+    if leaves_path is not None:
+        _worker_leave_values = load_leaves(leaves_path)
+
+
+# the letters on the board one row per string, "." for empty squares and lowercase for blanks
+def board_rows(board):
+    return ["".join(square.letter.lower() if square.is_blank else square.letter if square.letter else "."
+                    for square in row) for row in board]
+
+
+# play a test case to completion in a GameSession and return its results as a dict
+def play_case(root, test_number, ordered_letters, board_definition, prune=False, leave_values=None):
+    start = time.perf_counter()
+    session = GameSession(root, board_definition, ordered_letters, leave_values=leave_values)
+    session.play(prune)
+
+    turns = []
+    for turn in session.turns:
+        move = turn.move
+        if move is None:
+            turns.append({"rack": "".join(turn.rack), "word": None, "score": 0, "seconds": turn.seconds})
+        else:
+            turns.append({"rack": "".join(turn.rack), "word": move.word, "row": move.row, "col": move.col,
+                          "direction": "down" if move.vertical else "across", "blanks": move.blanks,
+                          "score": move.score, "leave": "".join(sorted(turn.leave)), "seconds": turn.seconds})
+    return {"case": test_number,
+            "score": session.score,
+            "num_moves": session.num_moves,
+            "turns": turns,
+            "rack": "".join(session.word_rack),
+            "board": board_rows(session.game.board),
+            "seconds": time.perf_counter() - start}
+
+
+def _play_case(test_case, prune):
+    return play_case(worker_root(), *test_case, prune=prune, leave_values=_worker_leave_values)
+
+
+# play every case of a tests file across a pool of worker processes, which all map the same compiled lexicon.
+# Yields the result of each case in file order.
+# leaves_path names a leave table (see leaves.py) to rank moves with.
+def run_batch(tests_path, lexicon_path="dictionary.txt", num_workers=None, case_numbers=None, prune=False,
+              leaves_path=None):
+    artifact_path = ensure_artifact(lexicon_path)
+    test_cases = parse_test_cases(parse_tests_file(tests_path))
+    if case_numbers is not None:
+        test_cases = [test_case for test_case in test_cases if test_case[0] in case_numbers]
+
+    with multiprocessing.Pool(num_workers, _init_worker, (artifact_path, leaves_path)) as pool:
+        yield from pool.imap(functools.partial(_play_case, prune=prune), test_cases)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play every test case of a file without the UI and write the "
+                                                 "results as JSON lines, one per case, then a summary line.")
+    parser.add_argument("tests", nargs="?", default="C2.txt")
+    parser.add_argument("--lexicon", default="dictionary.txt")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, default one per CPU")
+    parser.add_argument("--cases", type=int, nargs="+", default=None, help="only play these case numbers")
+    parser.add_argument("--prune", action="store_true", help="use the pruned best move search")
+    parser.add_argument("--leaves", default=None, help="leave table to rank moves with, see leaves.py")
+    parser.add_argument("--output", default=None, help="file to write to, default stdout")
+    args = parser.parse_args(argv)
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    start = time.perf_counter()
+    num_cases = num_turns = 0
+    try:
+        for result in run_batch(args.tests, args.lexicon, args.workers, args.cases, args.prune, args.leaves):
+            output.write(json.dumps(result) + "\n")
+            num_cases += 1
+            num_turns += len(result["turns"])
+        seconds = time.perf_counter() - start
+        output.write(json.dumps({"summary": {"cases": num_cases, "turns": num_turns, "seconds": seconds,
+                                             "cases_per_second": num_cases / seconds if seconds else 0.0}}) + "\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
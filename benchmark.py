@@ -0,0 +1,461 @@
+import copy
+import gc
+import os
+import pickle
+import sys
+import time
+import tracemalloc
+
+from dawg import *
+from board import ScrabbleBoard, BoardParams, PositionCache
+from session import GameSession, parse_tests_file, parse_test_cases, refill_word_rack
+from parallel import ParallelMoveGenerator
+from simulate import MonteCarloSimulator
+from endgame import EndgameSolver
+
+
+# play a C2.txt case to completion, returns number of moves made.
+# turn_times collects the latency of each get_best_move call when given.
+def play_case(root, ordered_letters, board_definition, turn_times=None):
+    board_params = BoardParams(board_definition)
+    tile_bag = list(ordered_letters.upper())
+    word_rack = tile_bag[:7]
+    del tile_bag[:7]
+    game = ScrabbleBoard(root, board_params)
+    word_rack = game.get_start_move(word_rack)
+    word_rack, new_letters = refill_word_rack(word_rack, tile_bag)
+    del tile_bag[:len(new_letters)]
+    num_moves = 1
+    while True:
+        start = time.perf_counter()
+        word_rack = game.get_best_move(word_rack)
+        if turn_times is not None:
+            turn_times.append(time.perf_counter() - start)
+        word_rack, new_letters = refill_word_rack(word_rack, tile_bag)
+        del tile_bag[:len(new_letters)]
+        if game.best_word == "":
+            if len(tile_bag) < 7:
+                return num_moves
+            word_rack, new_letters = refill_word_rack([], tile_bag)
+            del tile_bag[:len(new_letters)]
+        num_moves += 1
+
+
+def _traced(function):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, elapsed, allocated
+
+
+# compare the Node object graph with the packed edge table: resident Python heap once loaded and after a game
+# has been played, lookup latency over the whole word list and move generation latency
+def compare_dawg_representations(lexicon_path="dictionary.txt", tests_path="C2.txt", case_number=2):
+    lexicon = read_lexicon(lexicon_path)
+    artifact_path = ensure_artifact(lexicon_path)
+    test_case = [case for case in parse_test_cases(parse_tests_file(tests_path)) if case[0] == case_number][0]
+
+    roots = {}
+    print(f"{'representation':<16}{'load s':>10}{'heap MiB':>10}{'after game':>12}{'mapped MiB':>12}{'lookup s':>10}"
+          f"{'game s':>10}")
+    for name, loader, mapped in [
+        ("Node graph", lambda: build_dawg(lexicon), 0),
+        ("packed table", lambda: load_dawg(artifact_path), os.path.getsize(artifact_path)),
+    ]:
+        root, load_time, heap = _traced(loader)
+        roots[name] = root
+
+        start = time.perf_counter()
+        for word in lexicon:
+            find_in_dawg(word, root)
+        lookup_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        play_case(root, test_case[1], test_case[2])
+        game_time = time.perf_counter() - start
+
+        # the heap a fresh root holds once a game has been searched with it
+        def load_and_play():
+            played_root = loader()
+            play_case(played_root, test_case[1], test_case[2])
+            return played_root
+        _, _, heap_after_game = _traced(load_and_play)
+
+        print(f"{name:<16}{load_time:>10.3f}{heap / 2 ** 20:>10.1f}{heap_after_game / 2 ** 20:>12.1f}"
+              f"{mapped / 2 ** 20:>12.1f}{lookup_time:>10.3f}{game_time:>10.3f}")
+    return roots
+
+
+# per-turn get_best_move latency on the 15x15 C2.txt cases
+def benchmark_turns(lexicon_path="dictionary.txt", tests_path="C2.txt", case_numbers=(2, 3, 4)):
+    root = load_or_build_dawg(lexicon_path)
+    print(f"{'case':<6}{'turns':>7}{'mean ms':>10}{'p50 ms':>10}{'max ms':>10}")
+    for test_number, ordered_letters, board_definition in parse_test_cases(parse_tests_file(tests_path)):
+        if test_number not in case_numbers:
+            continue
+        turn_times = []
+        play_case(root, ordered_letters, board_definition, turn_times)
+        turn_times.sort()
+        print(f"{test_number:<6}{len(turn_times):>7}{1000 * sum(turn_times) / len(turn_times):>10.2f}"
+              f"{1000 * turn_times[len(turn_times) // 2]:>10.2f}{1000 * turn_times[-1]:>10.2f}")
+
+
+# transient memory the search allocates per get_best_move call, measured with tracemalloc. The Node graph
+# isolates the move generator; the packed table also counts the child lists it decodes on the way.
+def benchmark_allocations(lexicon_path="dictionary.txt", tests_path="C2.txt", case_number=2):
+    lexicon = read_lexicon(lexicon_path)
+    test_case = [case for case in parse_test_cases(parse_tests_file(tests_path)) if case[0] == case_number][0]
+    board_params = BoardParams(test_case[2])
+    print(f"{'representation':<16}{'turns':>7}{'mean KiB':>10}{'max KiB':>10}")
+    for name, root in [("Node graph", build_dawg(lexicon)), ("packed table", load_or_build_dawg(lexicon_path))]:
+        tile_bag = list(test_case[1].upper())
+        word_rack = tile_bag[:7]
+        del tile_bag[:7]
+        game = ScrabbleBoard(root, board_params)
+        peaks = []
+        tracemalloc.start()
+        while True:
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            word_rack = game.get_best_move(word_rack)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+            word_rack, new_letters = refill_word_rack(word_rack, tile_bag)
+            del tile_bag[:len(new_letters)]
+            if game.best_word == "":
+                if len(tile_bag) < 7:
+                    break
+                word_rack, new_letters = refill_word_rack([], tile_bag)
+                del tile_bag[:len(new_letters)]
+        tracemalloc.stop()
+        print(f"{name:<16}{len(peaks):>7}{sum(peaks) / len(peaks) / 1024:>10.1f}{max(peaks) / 1024:>10.1f}")
+
+
+# latency and peak traced memory of generate_moves per position of a C2.txt case, keeping the best k moves
+# in the bounded heap against materialising every move from the generator and sorting it
+def benchmark_top_k(lexicon_path="dictionary.txt", tests_path="C2.txt", case_number=2, k=20):
+    root = load_or_build_dawg(lexicon_path)
+    test_case = [case for case in parse_test_cases(parse_tests_file(tests_path)) if case[0] == case_number][0]
+    modes = {f"top {k}": lambda game, word_rack: game.generate_moves(word_rack, k),
+             "all moves": lambda game, word_rack: sorted(game.generate_moves(word_rack), reverse=True)[:k]}
+    results = {name: ([], []) for name in modes}
+    tile_bag = list(test_case[1].upper())
+    word_rack = tile_bag[:7]
+    del tile_bag[:7]
+    game = ScrabbleBoard(root, BoardParams(test_case[2]))
+    num_moves = []
+    while True:
+        # the first search of a position also decodes the packed DAWG nodes it visits, count that in neither
+        num_moves.append(sum(1 for _ in game.generate_moves(word_rack)))
+        for name, generate in modes.items():
+            times, peaks = results[name]
+            start = time.perf_counter()
+            generate(game, word_rack)
+            times.append(time.perf_counter() - start)
+            tracemalloc.start()
+            generate(game, word_rack)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        word_rack = game.get_best_move(word_rack)
+        word_rack, new_letters = refill_word_rack(word_rack, tile_bag)
+        del tile_bag[:len(new_letters)]
+        if game.best_word == "":
+            break
+    print(f"{len(num_moves)} positions, {sum(num_moves) / len(num_moves):.0f} moves on average, "
+          f"{max(num_moves)} at most")
+    print(f"{'mode':<12}{'mean ms':>10}{'mean KiB':>10}{'max KiB':>10}")
+    for name, (times, peaks) in results.items():
+        print(f"{name:<12}{1000 * sum(times) / len(times):>10.2f}{sum(peaks) / len(peaks) / 1024:>10.1f}"
+              f"{max(peaks) / 1024:>10.1f}")
+
+
+# search nodes (_left_part and _extend_right calls) and wall time of the exhaustive and the pruned best move
+# search, over every position of the C2.txt cases as played by the exhaustive search
+def benchmark_pruning(lexicon_path="dictionary.txt", tests_path="C2.txt"):
+    root = load_or_build_dawg(lexicon_path)
+    modes = {"exhaustive": False, "pruned": True}
+    print(f"{'case':<6}{'turns':>7}" + "".join(f"{name + ' nodes':>18}{name + ' ms':>15}" for name in modes))
+    totals = {name: [0, 0.0] for name in modes}
+    for test_number, ordered_letters, board_definition in parse_test_cases(parse_tests_file(tests_path)):
+        results = {name: [0, 0.0] for name in modes}
+        tile_bag = list(ordered_letters.upper())
+        word_rack = tile_bag[:7]
+        del tile_bag[:7]
+        game = ScrabbleBoard(root, BoardParams(board_definition))
+        num_turns = 0
+        while True:
+            for name, prune in modes.items():
+                start = time.perf_counter()
+                game.generate_moves(word_rack, 1, prune)
+                results[name][1] += time.perf_counter() - start
+                results[name][0] += _count_search_nodes(game, word_rack, prune)
+            num_turns += 1
+            word_rack = game.get_best_move(word_rack)
+            word_rack, new_letters = refill_word_rack(word_rack, tile_bag)
+            del tile_bag[:len(new_letters)]
+            if game.best_word == "":
+                break
+        print(f"{test_number:<6}{num_turns:>7}" + "".join(f"{nodes:>18}{1000 * seconds:>15.1f}"
+                                                          for nodes, seconds in results.values()))
+        for name in modes:
+            totals[name][0] += results[name][0]
+            totals[name][1] += results[name][1]
+    print(f"{'all':<6}{'':>7}" + "".join(f"{nodes:>18}{1000 * seconds:>15.1f}" for nodes, seconds in totals.values()))
+
+
+def _count_search_nodes(game, word_rack, prune):
+    num_nodes = [0]
+
+    def counted(method):
+        def wrapper(*args):
+            num_nodes[0] += 1
+            return method(*args)
+        return wrapper
+
+    game._left_part = counted(game._left_part)
+    game._extend_right = counted(game._extend_right)
+    try:
+        game.generate_moves(word_rack, 1, prune)
+    finally:
+        del game._left_part, game._extend_right
+    return num_nodes[0]
+
+
+# wall time of the top k search over every position of the C2.txt cases, serially and split across 1 to
+# max_workers processes, with the speedup over the serial search and whether the moves matched it
+def benchmark_parallel(lexicon_path="dictionary.txt", tests_path="C2.txt", k=20, max_workers=None):
+    root = load_or_build_dawg(lexicon_path)
+    positions = []
+    for test_number, ordered_letters, board_definition in parse_test_cases(parse_tests_file(tests_path)):
+        tile_bag = list(ordered_letters.upper())
+        word_rack = tile_bag[:7]
+        del tile_bag[:7]
+        game = ScrabbleBoard(root, BoardParams(board_definition))
+        while True:
+            positions.append((pickle.loads(pickle.dumps(game)), list(word_rack)))
+            word_rack = game.get_best_move(word_rack)
+            word_rack, new_letters = refill_word_rack(word_rack, tile_bag)
+            del tile_bag[:len(new_letters)]
+            if game.best_word == "":
+                break
+    for game, word_rack in positions:
+        game.dawg_root = root
+
+    start = time.perf_counter()
+    expected = [game.generate_moves(word_rack, k) for game, word_rack in positions]
+    serial_seconds = time.perf_counter() - start
+    print(f"{len(positions)} positions, top {k}, {os.cpu_count()} cpus")
+    print(f"{'workers':<9}{'ms':>10}{'speedup':>9}{'matches':>9}")
+    print(f"{'serial':<9}{1000 * serial_seconds:>10.1f}{1.0:>9.2f}{'':>9}")
+    for num_workers in range(1, (max_workers or os.cpu_count()) + 1):
+        with ParallelMoveGenerator(lexicon_path, num_workers) as generator:
+            generator.generate_moves(*positions[0], k)
+            start = time.perf_counter()
+            moves = [generator.generate_moves(game, word_rack, k) for game, word_rack in positions]
+            seconds = time.perf_counter() - start
+        matches = all([vars(move) for move in found] == [vars(move) for move in wanted]
+                      for found, wanted in zip(moves, expected))
+        print(f"{num_workers:<9}{1000 * seconds:>10.1f}{serial_seconds / seconds:>9.2f}{str(matches):>9}")
+
+
+# play every C2.txt case to completion twice with one PositionCache, the second time replaying the positions of
+# the first, and compare the time per best move search of the two passes. Also checks that the replay plays the
+# same moves.
+def benchmark_position_cache(lexicon_path="dictionary.txt", tests_path="C2.txt"):
+    root = load_or_build_dawg(lexicon_path)
+    test_cases = parse_test_cases(parse_tests_file(tests_path))
+    cache = PositionCache()
+    print(f"{'pass':<8}{'turns':>7}{'mean us':>10}{'max us':>10}{'hits':>7}{'misses':>8}{'matches':>9}")
+    played = None
+    for name in ("search", "replay"):
+        hits, misses = cache.hits, cache.misses
+        turn_seconds = []
+        moves = []
+        for test_number, ordered_letters, board_definition in test_cases:
+            session = GameSession(root, board_definition, ordered_letters, position_cache=cache)
+            session.play()
+            turn_seconds += [turn.seconds for turn in session.turns]
+            moves += [vars(turn.move) if turn.move else None for turn in session.turns]
+        matches = "" if played is None else str(moves == played)
+        played = moves
+        print(f"{name:<8}{len(turn_seconds):>7}{1e6 * sum(turn_seconds) / len(turn_seconds):>10.1f}"
+              f"{1e6 * max(turn_seconds):>10.1f}{cache.hits - hits:>7}{cache.misses - misses:>8}{matches:>9}")
+    print(cache.stats())
+
+
+# time to try each of the top 10 moves of every C2.txt position and take it back, with make_move and
+# unmake_move, against copying the board with copy.deepcopy and playing the move on the copy
+def benchmark_make_unmake(lexicon_path="dictionary.txt", tests_path="C2.txt", k=10):
+    root = load_or_build_dawg(lexicon_path)
+    make_seconds = copy_seconds = 0.0
+    num_moves = num_tiles = 0
+    for test_number, ordered_letters, board_definition in parse_test_cases(parse_tests_file(tests_path)):
+        session = GameSession(root, board_definition, ordered_letters)
+        game = session.game
+        while not session.over:
+            moves = game.generate_moves(session.word_rack, k)
+            start = time.perf_counter()
+            for move in moves:
+                game.unmake_move(game.make_move(move))
+            make_seconds += time.perf_counter() - start
+
+            # copies leave the DAWG out, see ScrabbleBoard.__getstate__
+            start = time.perf_counter()
+            for move in moves:
+                board_copy = copy.deepcopy(game)
+                board_copy.dawg_root = root
+                board_copy.insert_word(move.row, move.col, move.word, vertical=move.vertical, blanks=move.blanks)
+            copy_seconds += time.perf_counter() - start
+
+            num_moves += len(moves)
+            num_tiles += sum(len(move.tiles) for move in moves)
+            session.play_turn()
+    print(f"{num_moves} moves, {num_tiles / num_moves:.1f} tiles each")
+    print(f"{'method':<16}{'us per move':>12}")
+    print(f"{'make/unmake':<16}{1e6 * make_seconds / num_moves:>12.1f}")
+    print(f"{'deepcopy':<16}{1e6 * copy_seconds / num_moves:>12.1f}")
+
+
+# rollouts per second of MonteCarloSimulator on a position from the middle of C2.txt case 2, in this process and
+# across 1 to max_workers worker processes, each with the same time budget
+def benchmark_simulation(lexicon_path="dictionary.txt", tests_path="C2.txt", case_number=2, num_turns=10,
+                         time_budget=3.0, max_workers=None):
+    root = load_or_build_dawg(lexicon_path)
+    test_cases = {test_number: (ordered_letters, board_definition)
+                  for test_number, ordered_letters, board_definition in parse_test_cases(parse_tests_file(tests_path))}
+    ordered_letters, board_definition = test_cases[case_number]
+    session = GameSession(root, board_definition, ordered_letters)
+    for _ in range(num_turns):
+        session.play_turn()
+    greedy = session.game.generate_moves(session.word_rack, 1)[0]
+    print(f"rack {''.join(session.word_rack)}, {len(session.tile_bag)} unseen tiles, greedy {greedy}, "
+          f"{os.cpu_count()} cpus")
+
+    print(f"{'workers':<9}{'rollouts':>10}{'seconds':>9}{'per second':>12}  chosen")
+    for num_workers in range(0, (max_workers or os.cpu_count()) + 1):
+        with MonteCarloSimulator(lexicon_path, num_workers) as simulator:
+            result = simulator.simulate(session.game, session.word_rack, session.tile_bag, time_budget=time_budget)
+        print(f"{num_workers or 'inline':<9}{result.num_rollouts:>10}{result.seconds:>9.2f}"
+              f"{result.rollouts_per_second:>12.1f}  {result.move} {result.candidates[0][1]:.1f}")
+
+
+# plays each case greedily until the bag is empty, then finishes it greedily and in a session solving every
+# endgame turn within time_limit, and solves the two-player endgame of the final rack split into two racks of
+# three tiles
+def benchmark_endgame(lexicon_path="dictionary.txt", tests_path="C2.txt", time_limit=1.0):
+    root = load_or_build_dawg(lexicon_path)
+    print(f"{'case':<6}{'rack':<9}{'greedy':>8}{'solver':>8}{'turns':>7}{'exact':>7}{'max s':>7}"
+          f"{'2 racks':>9}{'exact':>7}{'seconds':>9}")
+    for test_number, ordered_letters, board_definition in parse_test_cases(parse_tests_file(tests_path)):
+        greedy = GameSession(root, board_definition, ordered_letters)
+        solved = GameSession(root, board_definition, ordered_letters, endgame_time=time_limit)
+        for session in (greedy, solved):
+            while session.tile_bag and not session.over:
+                session.play_turn()
+        if greedy.over:
+            continue
+        rack = list(greedy.word_rack)
+        two_racks = EndgameSolver(greedy.game).solve([rack[:3], rack[3:6]], time_limit)
+        start_score, num_turns = greedy.score, len(greedy.turns)
+        greedy.play()
+        solved.play()
+        endgame_turns = solved.turns[num_turns:]
+        print(f"{test_number:<6}{''.join(rack):<9}{greedy.score - start_score:>8}{solved.score - start_score:>8}"
+              f"{len(endgame_turns):>7}{sum(turn.completed for turn in endgame_turns):>7}"
+              f"{max(turn.seconds for turn in endgame_turns):>7.2f}{two_racks.value:>9}{str(two_racks.exact):>7}"
+              f"{two_racks.seconds:>9.3f}")
+
+
+# plays every case with each per-move time limit: the latency of the searches, how many were cut short and the
+# score that cost
+def benchmark_anytime(lexicon_path="dictionary.txt", tests_path="C2.txt", move_times=(None, 0.02, 0.005, 0.002)):
+    root = load_or_build_dawg(lexicon_path)
+    test_cases = list(parse_test_cases(parse_tests_file(tests_path)))
+    print(f"{'limit ms':<10}{'turns':>7}{'cut short':>11}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'score':>8}")
+    for move_time in move_times:
+        turns = []
+        score = 0
+        for test_number, ordered_letters, board_definition in test_cases:
+            session = GameSession(root, board_definition, ordered_letters, move_time=move_time)
+            score += session.play()
+            turns += session.turns
+        seconds = sorted(turn.seconds for turn in turns)
+        limit = f"{move_time * 1000:g}" if move_time is not None else "none"
+        print(f"{limit:<10}{len(turns):>7}{sum(not turn.completed for turn in turns):>11}"
+              f"{seconds[len(seconds) // 2] * 1000:>9.2f}{seconds[len(seconds) * 99 // 100] * 1000:>9.2f}"
+              f"{seconds[-1] * 1000:>9.2f}{score:>8}")
+
+
+class _NodeUnpickler(pickle.Unpickler):
+    # the shipped pickle was written from dawg.py's __main__
+    def find_class(self, module, name):
+        if name == "Node":
+            return Node
+        return super().find_class(module, name)
+
+
+# the 279k word list itself isn't shipped, so fall back to reading it back out of the pickled DAWG
+def load_complete_lexicon(text_path="lexicon/scrabble_words_complete.txt",
+                          pickle_path="lexicon/scrabble_words_complete.pickle"):
+    if os.path.exists(text_path):
+        return read_lexicon(text_path)
+    with open(pickle_path, "rb") as file:
+        root = _NodeUnpickler(file).load()
+    return sorted(dawg_words(root))
+
+
+# enumerate the language accepted by a dawg
+def dawg_words(root):
+    words = []
+    stack = [(root, "")]
+    while stack:
+        node, prefix = stack.pop()
+        if node.is_terminal:
+            words.append(prefix)
+        for letter, child in node.children.items():
+            stack.append((child, prefix + letter))
+    return words
+
+
+# time build_dawg on each lexicon and check the graph accepts exactly the source words
+def benchmark_build(lexicons=None):
+    if lexicons is None:
+        lexicons = {"dictionary.txt": read_lexicon("dictionary.txt"),
+                    "complete (279k)": load_complete_lexicon()}
+    print(f"{'lexicon':<18}{'words':>9}{'nodes':>9}{'build s':>10}{'verified':>10}")
+    for name, lexicon in lexicons.items():
+        start = time.perf_counter()
+        root = build_dawg(lexicon)
+        elapsed = time.perf_counter() - start
+        num_nodes = len({id(node) for node in _iter_nodes(root)})
+        verified = all(find_in_dawg(word, root) for word in lexicon) and \
+            len(dawg_words(root)) == len(set(lexicon))
+        print(f"{name:<18}{len(lexicon):>9}{num_nodes:>9}{elapsed:>10.3f}{str(verified):>10}")
+
+
+def _iter_nodes(root):
+    seen = {id(root)}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        yield node
+        for child in node.children.values():
+            if id(child) not in seen:
+                seen.add(id(child))
+                stack.append(child)
+
+
+if __name__ == "__main__":
+    sys.setrecursionlimit(10000)
+    benchmarks = {"dawg": compare_dawg_representations, "build": benchmark_build, "turns": benchmark_turns,
+                  "allocations": benchmark_allocations, "top_k": benchmark_top_k,
+                  "pruning": benchmark_pruning, "parallel": benchmark_parallel,
+                  "position_cache": benchmark_position_cache, "make_unmake": benchmark_make_unmake,
+                  "simulation": benchmark_simulation, "endgame": benchmark_endgame,
+                  "anytime": benchmark_anytime}
+    for name in sys.argv[1:] or benchmarks:
+        benchmarks[name]()
@@ -1,5 +1,35 @@
-import regex as re
-import copy
+import heapq
+import random
+import time
+from collections import OrderedDict
+
+from rack import BLANK, RACK_INDEX, rack_counts
+
+# cross-checks are 26-bit masks, bit i set if chr(65 + i) may be placed on the square
+ALL_CROSS_CHECKS = (1 << 26) - 1
+LETTER_BITS = {chr(65 + i): 1 << i for i in range(26)}
+
+# orientation of a play, used to index the per-orientation values stored on each square
+HORIZONTAL = 0
+VERTICAL = 1
+
+# letter and word multipliers of each square modifier
+PREMIUMS = {"2LS": (2, 1), "3LS": (3, 1), "2WS": (1, 2), "3WS": (1, 3)}
+# square modifier of each special tile type in a board definition
+SPECIAL_TILES = {"W": "3WS", "w": "2WS", "L": "3LS", "l": "2LS"}
+
+BINGO_TILES = 7
+BINGO_BONUS = 50
+
+# calls of _extend_right between checks of a search's deadline and cancellation, see _check_search
+SEARCH_CHECK_INTERVAL = 256
+
+# Zobrist keys of each board size, see zobrist_table
+_zobrist_tables = {}
+
+# premium grids by layout, see BoardParams.premium_grid
+_premium_grids = {}
+
 
 class BoardParams:
     def __init__(self, board_def):
@@ -12,13 +42,110 @@ class BoardParams:
             row, col, tile_type = board_lines[i].split(',')
             self.special_tiles[(int(row), int(col))] = tile_type
 
+    # the premium grid of this layout, built on first use and shared with every equal layout
+    @property
+    def premium_grid(self):
+        key = (self.num_rows, self.num_cols, tuple(sorted(self.special_tiles.items())))
+        grid = _premium_grids.get(key)
+        if grid is None:
+            grid = _premium_grids[key] = PremiumGrid(self.num_rows, self.num_cols, self.special_tiles)
+        return grid
+
+    # identifies the layout: boards with equal tiles and layout ids have the same moves
+    @property
+    def layout_id(self):
+        return (self.num_rows, self.num_cols, self.start_row, self.start_col,
+                tuple(sorted(self.special_tiles.items())))
+
+
+# random 64-bit keys for the Zobrist hash of a board of the given size, table[row][col][tile] where tile is the
+# letter's index, plus 26 for a blank. The keys are seeded by the size, so hashes agree across processes.
+def zobrist_table(num_rows, num_cols):
+    table = _zobrist_tables.get((num_rows, num_cols))
+    if table is None:
+        rng = random.Random(f"zobrist {num_rows}x{num_cols}")
+        table = _zobrist_tables[num_rows, num_cols] = [[[rng.getrandbits(64) for tile in range(52)]
+                                                        for col in range(num_cols)] for row in range(num_rows)]
+    return table
+
+
+# least recently used cache of move searches, keyed by (board hash, sorted rack, layout id, k) and shared by
+# any number of boards searching with the same lexicon. Holds at most max_size results.
+class PositionCache:
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # the moves stored for key, None if there are none
+    def get(self, key):
+        moves = self.entries.get(key)
+        if moves is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return moves
+
+    def put(self, key, moves):
+        self.entries[key] = moves
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self.entries)}
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+
+# raised inside a search that ran out of time or was cancelled, see search_best_moves
+class _SearchStopped(Exception):
+    pass
+
+
+# letter and word multipliers of every square of a board layout. The multipliers of each line are stored in
+# bytes indexed like ScrabbleBoard.lines, [orientation][line][position], so the search reads them directly.
+# A grid is never modified: premiums only count for tiles placed on empty squares, so covered squares need
+# no reset.
+class PremiumGrid:
+    def __init__(self, num_rows, num_cols, special_tiles):
+        self.modifiers = [["Normal"] * num_cols for _ in range(num_rows)]
+        letter_multipliers = [bytearray(b"\x01" * num_cols) for _ in range(num_rows)]
+        word_multipliers = [bytearray(b"\x01" * num_cols) for _ in range(num_rows)]
+        for (row, col), tile_type in special_tiles.items():
+            # other tile types in the test files carry no premium
+            modifier = SPECIAL_TILES.get(tile_type)
+            if modifier is None:
+                continue
+            self.modifiers[row][col] = modifier
+            letter_multipliers[row][col], word_multipliers[row][col] = PREMIUMS[modifier]
+
+        self.letter_lines = [[bytes(row) for row in letter_multipliers],
+                             [bytes(column) for column in zip(*letter_multipliers)]]
+        self.word_lines = [[bytes(row) for row in word_multipliers],
+                           [bytes(column) for column in zip(*word_multipliers)]]
+
+
 class Square:
     # default behavior is blank square, no score modifier, all cross-checks valid
     def __init__(self, letter=None, modifier="Normal", sentinel=1):
         self.letter = letter
-        self.cross_checks_0 = [sentinel] * 26
-        self.cross_checks_1 = [sentinel] * 26
-        self.cross_checks = self.cross_checks_0
+        # score of the tile on this square, 0 for blanks
+        self.tile_score = 0
+        self.is_blank = False
+        # cross-check masks for horizontal and vertical plays through this square
+        self.cross_checks = [ALL_CROSS_CHECKS if sentinel else 0] * 2
+        # letter score of the orthogonal word fragment a tile placed here would join, per orientation, and the
+        # multiplier that word is scored with: the square's word multiplier, or 0 if there is no such word
+        self.cross_sums = [0, 0]
+        self.cross_multipliers = [0, 0]
+        # only used for drawing, scoring reads the board's premium grid
         self.modifier = modifier
         self.visible = True
         if sentinel == 0:
@@ -32,258 +159,541 @@ class Square:
         else:
             return self.letter
 
-    # maintain two separate cross-check lists depending on if the board is transpose or not
-    def check_switch(self, is_transpose):
-        if is_transpose:
-            self.cross_checks = self.cross_checks_1
-        else:
-            self.cross_checks = self.cross_checks_0
+
+# a play found by the search. row and col are the board coordinates of its first square and word is the whole
+# word, including tiles already on the board. blanks holds the indices of word played with blank tiles and
+# tiles the rack tiles the play uses, in word order with "%" for blanks. equity is its score plus the value of
+# the tiles it leaves on the rack when the board has a leave table (see leaves.py), otherwise just its score.
+class Move:
+    def __init__(self, row, col, vertical, word, blanks, tiles, score, equity=None):
+        self.row = row
+        self.col = col
+        self.vertical = vertical
+        self.word = word
+        self.blanks = blanks
+        self.tiles = tiles
+        self.score = score
+        self.equity = score if equity is None else equity
+
+    # moves rank by equity, ties go to horizontal plays, then the topmost and leftmost start, then the word,
+    # then the earliest blanks, so no two different moves tie
+    def _rank(self):
+        return -self.equity, self.vertical, self.row, self.col, self.word, self.blanks
+
+    # a move is less than another if it ranks below it
+    def __lt__(self, other):
+        return self._rank() > other._rank()
+
+    def __repr__(self):
+        direction = "down" if self.vertical else "across"
+        return f"Move({self.word} at {self.row},{self.col} {direction}, {self.score})"
+
+
+# what make_move changed on the board, for unmake_move to restore: the squares it placed tiles on, the old
+# cross-check values of the squares next to them as (row, col, orientation, mask, sum, multiplier), the old
+# anchor limits as (orientation, key, limit), None where there was no anchor, and the old Zobrist hash.
+# Everything is recorded in the order it changed, so it is restored in reverse.
+class MoveDelta:
+    def __init__(self, move, zobrist_hash):
+        self.move = move
+        self.placed_squares = []
+        self.cross_checks = []
+        self.anchors = []
+        self.zobrist_hash = zobrist_hash
+
+
+# per-position sums over one line of the board, used to bound what a play along it can score.
+# Prefix values at x cover positions before x; empty squares contribute their premiums and cross-words,
+# tiles their scores.
+class LineBounds:
+    def __init__(self, line, letter_line, word_line, orientation):
+        self.letter_line = letter_line
+        # positions of the empty squares, and the index in that list of the first empty square at or after
+        # each position
+        self.empties = []
+        self.next_empty = []
+        self.tile_sums = [0]
+        self.word_products = [1]
+        self.cross_sums = [0]
+        self.cross_multipliers = []
+        for col, square in enumerate(line):
+            self.next_empty.append(len(self.empties))
+            if square.letter:
+                self.tile_sums.append(self.tile_sums[-1] + square.tile_score)
+                self.word_products.append(self.word_products[-1])
+                self.cross_sums.append(self.cross_sums[-1])
+                self.cross_multipliers.append(0)
+            else:
+                self.empties.append(col)
+                cross_multiplier = square.cross_multipliers[orientation]
+                self.tile_sums.append(self.tile_sums[-1])
+                self.word_products.append(self.word_products[-1] * word_line[col])
+                self.cross_sums.append(self.cross_sums[-1] + square.cross_sums[orientation] * cross_multiplier)
+                self.cross_multipliers.append(cross_multiplier)
+        self.next_empty.append(len(self.empties))
+
+    # end of the squares a play can reach from col by placing num_tiles tiles
+    def reach(self, col, num_tiles):
+        index = self.next_empty[col] + num_tiles
+        return self.empties[index] if index < len(self.empties) else len(self.next_empty) - 1
 
 
 class ScrabbleBoard:
-    def __init__(self, dawg_root, board_params):
+    def __init__(self, dawg_root, board_params, position_cache=None, leave_values=None):
 
         self.board_params = board_params
+        self.premiums = board_params.premium_grid
         self.board = []
         for row in range(self.board_params.num_rows):
             row_list = []
             for col in range(self.board_params.num_cols):
-                row_list.append(Square())
+                row_list.append(Square(modifier=self.premiums.modifiers[row][col]))
             self.board.append(row_list)
 
+        # column-oriented view of the same squares. Vertical plays are searched along these lines exactly like
+        # horizontal plays along self.board, so nothing is copied to switch orientation.
+        self.columns = [list(column) for column in zip(*self.board)]
+        self.lines = [self.board, self.columns]
+
+        # the play being searched, one entry per square from the start of the word: the letter on it and
+        # whether that letter is a blank. Entry i lies at position start + i of the line, and entries are
+        # overwritten as the search backtracks, so exploring an edge allocates nothing.
+        path_length = max(self.board_params.num_rows, self.board_params.num_cols)
+        self.path_letters = [None] * path_length
+        self.path_blanks = [False] * path_length
+
         self.point_dict = {'A': 1, 'B': 3, 'C': 3, 'D': 2, 'E': 1, 'F': 4, 'G': 2,
                      'H': 4, 'I': 1, 'J': 8, 'K': 5, 'L': 1, 'M': 3,
                      'N': 1, 'O': 1, 'P': 3, 'Q': 10, 'R': 1, 'S': 1, 'T': 1,
-                     'U': 1, 'V': 4, 'W': 4, 'X': 8, 'Y': 4, 'Z': 10};
+                     'U': 1, 'V': 4, 'W': 4, 'X': 8, 'Y': 4, 'Z': 10, '%': 0};
 
-        self.words_on_board = []
+        # orientation currently being searched
+        self.orientation = HORIZONTAL
 
-        self.is_transpose = False
+        # empty squares next to a tile where a play in the given orientation can attach, stored as
+        # (line, position) in that orientation's view and mapped to the anchor's left-part limit: the number of
+        # empty squares directly before it that touch no tile. On an empty board the start square is the only anchor.
+        self.anchors = [{(board_params.start_row, board_params.start_col): board_params.start_col}, {}]
 
-        # variables to encode best word on a given turn
+        # moves collected by the current search: a min-heap of the best top_k moves, or every move found
+        # from the current anchor when top_k is None. Plays scoring below min_score are not collected.
         self.dawg_root = dawg_root
+        self._moves = []
+        self._top_k = None
+        self._min_score = 0
+
+        # used to bound the score of plays through each anchor when searching with prune: LineBounds of every
+        # line indexed like self.lines, None for lines a tile was placed next to since they were built, and the
+        # number of tiles on the rack, their points, highest first, its letters and whether it has a blank
+        self._line_bounds = [[None] * board_params.num_rows, [None] * board_params.num_cols]
+        self._rack_size = 0
+        self._rack_values = []
+        self._rack_letters = set()
+        self._has_blank = False
+        # the most points a rack tile on a square is worth by cross-check mask, see _tile_value
+        self._tile_values = {}
+        # whether any word goes on from a DAWG node for some number of letters, by (node id, letters)
+        self._suffix_lengths = {}
+
+        # Zobrist hash of the tiles on the board, updated as they are placed, and the cache of searches it keys
+        self.zobrist_hash = 0
+        self._zobrist_keys = zobrist_table(board_params.num_rows, board_params.num_cols)
+        self.layout_id = board_params.layout_id
+        self.position_cache = position_cache
+
+        # perf_counter time and cancellation event (anything with is_set) that stop the current search, whether
+        # the deadline waits for a move to be found, and the calls of _extend_right left until they are checked
+        self._deadline = None
+        self._cancel = None
+        self._require_move = False
+        self._calls_until_check = SEARCH_CHECK_INTERVAL
+
+        # MoveDelta being recorded by make_move, None otherwise
+        self._delta = None
+
+        # LeaveValues table that moves are ranked with, and during a search the value of the leave of each
+        # play by its sorted rack tiles (see LeaveValues.for_rack) and the most any leave is worth
+        self.leave_values = leave_values
+        self._leave_values = None
+        self._max_leave_value = 0
+
+        # move played on the last turn
         self.word_rack = []
         self.word_score_dict = {}
+        self.best_move = None
         self.best_word = ""
         self.highest_score = 0
-        self.dist_from_anchor = 0
-        self.letters_from_rack = []
-
-        # rows and columns of highest-scoring word found so far.
-        # these are the rows and columns of the tile already on the board
-        self.best_row = 0
-        self.best_col = 0
-
-        # store squares that need updated cross-checks
-        self.upper_cross_check = []
-        self.lower_cross_check = []
-
-    # transpose method that modifies self.board inplace
-    def _transpose(self):
-        # https://datagy.io/python-transpose-list-of-lists/
-        transposed_tuples = copy.deepcopy(list(zip(*self.board)))
-        self.board = [list(sublist) for sublist in transposed_tuples]
-        self.is_transpose = not self.is_transpose
-
-    # TODO: fix scoring errors
-    def _score_word(self, word, squares, dist_from_anchor):
-        score = 0
-        score_multiplier = 1
-
-        if self.is_transpose:
-            cross_sum_ind = "-"
-        else:
-            cross_sum_ind = "+"
-
-        # word that will be inserted onto board shouldn't have wildcard indicator
-        board_word = word.replace("%", "")
 
-        # don't add words that are already on the board
-        if board_word in self.words_on_board:
-            return board_word, 0
-
-        # remove letters before wildcard indicators
-        word = re.sub("[A-Z]%", "%", word)
+    # boards are sent to worker processes (see parallel.py) without the DAWG, which every worker maps from the
+    # compiled artifact itself, the caches of earlier searches or the Zobrist keys
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["dawg_root"] = None
+        state["_moves"] = []
+        state["_line_bounds"] = [[None] * len(line_bounds) for line_bounds in self._line_bounds]
+        state["_tile_values"] = {}
+        state["_suffix_lengths"] = {}
+        state["position_cache"] = None
+        del state["_zobrist_keys"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._zobrist_keys = zobrist_table(self.board_params.num_rows, self.board_params.num_cols)
+
+    # collect the play held in the first depth path entries, which ends just before end_col
+    def _record_play(self, square_row, end_col, depth, score):
+        start_col = end_col - depth
+        line = self.lines[self.orientation][square_row]
 
         # maintain list of which tiles were pulled from word rack
         rack_tiles = []
-        for letter, square in zip(word, squares):
-            # add cross-sum by adding first and second letter scores from orthogonal two-letter word
-            if cross_sum_ind in square.modifier:
-                score += int(square.modifier[-1])
-            if square.modifier:
-                rack_tiles.append(letter)
-            if "2LS" in square.modifier:
-                score += (self.point_dict[letter] * 2)
-            elif "3LS" in square.modifier:
-                score += (self.point_dict[letter] * 3)
-            elif "2WS" in square.modifier:
-                score_multiplier *= 2
-                score += self.point_dict[letter]
-            elif "3WS" in square.modifier:
-                score_multiplier *= 3
-                score += self.point_dict[letter]
-            else:
-                score += self.point_dict[letter]
-
-        score *= score_multiplier
-
-        # check for bingo
-        if len(rack_tiles) == 7:
-            score += 50
+        blanks = []
+        for i in range(depth):
+            if not line[start_col + i].letter:
+                if self.path_blanks[i]:
+                    rack_tiles.append("%")
+                    blanks.append(i)
+                else:
+                    rack_tiles.append(self.path_letters[i])
 
-        if score > self.highest_score:
-            self.best_word = board_word
-            self.highest_score = score
-            # distance of leftmost placed tile from anchor. if anchor is leftmost tile distance will be 0.
-            self.dist_from_anchor = dist_from_anchor
-            self.letters_from_rack = rack_tiles
+        equity = score
+        if self._leave_values is not None:
+            equity += self._leave_values["".join(sorted(rack_tiles))]
 
-    def _extend_right(self, start_node, square_row, square_col, rack, word, squares, dist_from_anchor):
-        square = self.board[square_row][square_col]
-        square.check_switch(self.is_transpose)
+        word = "".join(self.path_letters[:depth])
+        if self.orientation == VERTICAL:
+            move = Move(start_col, square_row, True, word, blanks, rack_tiles, score, equity)
+        else:
+            move = Move(square_row, start_col, False, word, blanks, rack_tiles, score, equity)
+
+        # once the heap is full, plays need min_score to reach the equity of its worst move with the best leave
+        if self._top_k is None:
+            self._moves.append(move)
+        elif len(self._moves) < self._top_k:
+            heapq.heappush(self._moves, move)
+            if len(self._moves) == self._top_k:
+                self._min_score = self._moves[0].equity - self._max_leave_value
+        elif self._moves[0] < move:
+            heapq.heapreplace(self._moves, move)
+            self._min_score = self._moves[0].equity - self._max_leave_value
+
+    # the most any play through an anchor can score, -1 if there is none. The play covers at most the empty
+    # squares its left part may use and as many squares right of the anchor as the rack can fill. Every word
+    # premium there is assumed covered and the best rack tiles to land where a letter point is worth the most,
+    # counting its letter premium and any cross-word, as long as their letters pass the square's cross-check.
+    def _anchor_bound(self, square_row, square_col):
+        line = self.lines[self.orientation][square_row]
+        bounds = self._line_bounds[self.orientation][square_row]
+        start_col = square_col
+        # DAWG node of any fixed left part and the position it ends at
+        node = self.dawg_root
+        node_col = None
+        if square_col > 0 and line[square_col - 1].letter:
+            node_col = square_col
+            while start_col > 0 and line[start_col - 1].letter:
+                start_col -= 1
+            for square in line[start_col:square_col]:
+                node = node.children.get(square.letter)
+                if node is None:
+                    return -1
+        else:
+            limit = self.anchors[self.orientation][(square_row, square_col)]
+            start_col -= min(limit, max(self._rack_size - 1, 0))
+        end_col = bounds.reach(square_col, self._rack_size)
+
+        # the play stops before the first square none of the rack tiles fit on, which may be the anchor itself
+        empties = bounds.empties[bounds.next_empty[start_col]:bounds.next_empty[end_col]]
+        tile_values = []
+        for i, col in enumerate(empties):
+            tile_value = self._tile_value(line[col].cross_checks[self.orientation])
+            if tile_value is None:
+                if col <= square_col:
+                    return -1
+                end_col = col
+                del empties[i:]
+                break
+            tile_values.append(tile_value)
+
+        word_multiplier = bounds.word_products[end_col] // bounds.word_products[start_col]
+        point_values = [bounds.letter_line[col] * (word_multiplier + bounds.cross_multipliers[col])
+                        for col in empties]
+        # pair the best tiles with the best squares, or put the best tile that fits on each square,
+        # whichever is lower
+        best_pairing = sum(value * point_value for value, point_value in
+                           zip(self._rack_values, sorted(point_values, reverse=True)))
+        best_fits = sum(sorted((min(tile_value, self._rack_values[0]) * point_value
+                                for tile_value, point_value in zip(tile_values, point_values)),
+                               reverse=True)[:self._rack_size])
+        score = (bounds.tile_sums[end_col] - bounds.tile_sums[start_col]) * word_multiplier + \
+            bounds.cross_sums[end_col] - bounds.cross_sums[start_col] + min(best_pairing, best_fits)
+
+        # a bingo needs room for every tile and a word going on from the fixed left part at least up to the
+        # last of them
+        if self._rack_size >= BINGO_TILES and len(empties) >= self._rack_size:
+            suffix_length = self._rack_size if node_col is None else empties[self._rack_size - 1] - node_col + 1
+            if self._has_suffix(node, suffix_length):
+                score += BINGO_BONUS
+        return score
+
+    # the most points a rack tile placed on a square with the given cross-check mask is worth, or None if no
+    # rack tile fits
+    def _tile_value(self, cross_checks):
+        tile_value = self._tile_values.get(cross_checks, -1)
+        if tile_value == -1:
+            fitting = [self.point_dict[letter] for letter in self._rack_letters if cross_checks & LETTER_BITS[letter]]
+            if fitting:
+                tile_value = max(fitting)
+            else:
+                tile_value = 0 if self._has_blank and cross_checks else None
+            self._tile_values[cross_checks] = tile_value
+        return tile_value
+
+    # whether some word continues from node for at least length more letters
+    def _has_suffix(self, node, length):
+        if length <= 0:
+            return True
+        key = (node.id, length)
+        result = self._suffix_lengths.get(key)
+        if result is None:
+            result = self._suffix_lengths[key] = any(self._has_suffix(child, length - 1)
+                                                     for child in node.children.values())
+        return result
+
+    # square_row and square_col index self.lines[self.orientation], so for vertical plays the "row" is a column.
+    # the play so far fills the first depth path entries and words are only scored once they extend past
+    # anchor_col, so every play covers its anchor. The score is kept as it grows: main_sum is the main word's
+    # letter sum, word_multiplier the product of the word premiums covered, cross_score the total of the
+    # cross-words formed and num_placed the number of rack tiles used.
+    def _extend_right(self, start_node, square_row, square_col, rack, depth, anchor_col,
+                      main_sum, word_multiplier, cross_score, num_placed):
+        self._calls_until_check -= 1
+        if not self._calls_until_check:
+            self._check_search()
+        line = self.lines[self.orientation][square_row]
+        if square_col == len(line):
+            if start_node.is_terminal and square_col > anchor_col:
+                score = main_sum * word_multiplier + cross_score
+                if num_placed == BINGO_TILES:
+                    score += BINGO_BONUS
+                if score >= self._min_score:
+                    self._record_play(square_row, square_col, depth, score)
+            return
+        square = line[square_col]
 
         # execute if square is empty
         if not square.letter:
-            if start_node.is_terminal:
-                self._score_word(word, squares, dist_from_anchor)
-            for letter in start_node.children:
-                # if square already has letters above and below it, don't try to extend
-                if (square_row + 1 <= self.board_params.num_rows - 1) and\
-                        self.board[square_row + 1][square_col].letter and \
-                        (square_row - 1 >= 0) and\
-                        self.board[square_row - 1][square_col].letter:
+            if start_node.is_terminal and square_col > anchor_col:
+                score = main_sum * word_multiplier + cross_score
+                if num_placed == BINGO_TILES:
+                    score += BINGO_BONUS
+                if score >= self._min_score:
+                    self._record_play(square_row, square_col, depth, score)
+
+            cross_checks = square.cross_checks[self.orientation]
+            cross_sum = square.cross_sums[self.orientation]
+            cross_multiplier = square.cross_multipliers[self.orientation]
+            letter_multiplier = self.premiums.letter_lines[self.orientation][square_row][square_col]
+            new_word_multiplier = word_multiplier * self.premiums.word_lines[self.orientation][square_row][square_col]
+            for letter, new_node in start_node.children.items():
+                if not cross_checks & LETTER_BITS[letter]:
                     continue
 
-                # conditional for blank squares
-                if letter in rack:
-                    wildcard = False
-                elif "%" in rack:
-                    wildcard = True
-                else:
-                    continue
-                if letter in rack and self._cross_check(letter, square):
-                    new_node = start_node.children[letter]
-                    new_rack = rack.copy()
-                    if wildcard:
-                        new_word = word + letter + "%"
-                        new_rack.remove("%")
-                    else:
-                        new_word = word + letter
-                        new_rack.remove(letter)
-                    new_squares = squares + [square]
-                    if square_col + 1 == self.board_params.num_cols:
-                        return
-                    self._extend_right(new_node, square_row, square_col + 1, new_rack, new_word, new_squares,
-                                       dist_from_anchor)
+                # take the tile from the rack, or a blank if it isn't there, and put it back afterwards
+                index = RACK_INDEX[letter]
+                if rack[index]:
+                    rack[index] -= 1
+                    self.path_letters[depth] = letter
+                    self.path_blanks[depth] = False
+                    letter_score = self.point_dict[letter] * letter_multiplier
+                    self._extend_right(new_node, square_row, square_col + 1, rack, depth + 1, anchor_col,
+                                       main_sum + letter_score, new_word_multiplier,
+                                       cross_score + (cross_sum + letter_score) * cross_multiplier, num_placed + 1)
+                    rack[index] += 1
+                elif rack[BLANK]:
+                    rack[BLANK] -= 1
+                    self.path_letters[depth] = letter
+                    self.path_blanks[depth] = True
+                    self._extend_right(new_node, square_row, square_col + 1, rack, depth + 1, anchor_col,
+                                       main_sum, new_word_multiplier, cross_score + cross_sum * cross_multiplier,
+                                       num_placed + 1)
+                    rack[BLANK] += 1
         else:
-            if square_col + 1 == self.board_params.num_cols:
-                return
             if square.letter in start_node.children:
                 new_node = start_node.children[square.letter]
-                new_word = word + square.letter
-                new_squares = squares + [square]
-                self._extend_right(new_node, square_row, square_col + 1, rack, new_word, new_squares,
-                                   dist_from_anchor)
-
-    def _left_part(self, start_node, anchor_square_row, anchor_square_col, rack, word, squares, limit,
-                   dist_from_anchor):
-        potential_square = self.board[anchor_square_row][anchor_square_col - dist_from_anchor]
-        potential_square.check_switch(self.is_transpose)
-        if potential_square.letter:
-            return
-        self._extend_right(start_node, anchor_square_row, anchor_square_col, rack, word, squares, dist_from_anchor)
-        if 0 in potential_square.cross_checks:
-            return
-        if limit > 0:
-            for letter in start_node.children:
-                # conditional for blank squares
-                if letter in rack:
-                    wildcard = False
-                elif "%" in rack:
-                    wildcard = True
-                else:
-                    continue
+                self.path_letters[depth] = square.letter
+                self.path_blanks[depth] = square.is_blank
+                self._extend_right(new_node, square_row, square_col + 1, rack, depth + 1, anchor_col,
+                                   main_sum + square.tile_score, word_multiplier, cross_score, num_placed)
+
+    # place up to limit rack tiles on the empty squares left of the anchor, then extend right through it.
+    # the left part so far fills the first depth path entries
+    def _left_part(self, start_node, anchor_square_row, anchor_square_col, rack, limit, depth):
+        # the left part's squares are only known once its length is, but none of them touch a tile
+        # so they only contribute letter and word premiums
+        letter_line = self.premiums.letter_lines[self.orientation][anchor_square_row]
+        word_line = self.premiums.word_lines[self.orientation][anchor_square_row]
+        main_sum = 0
+        word_multiplier = 1
+        for i in range(depth):
+            square_col = anchor_square_col - depth + i
+            if not self.path_blanks[i]:
+                main_sum += self.point_dict[self.path_letters[i]] * letter_line[square_col]
+            word_multiplier *= word_line[square_col]
+        self._extend_right(start_node, anchor_square_row, anchor_square_col, rack, depth, anchor_square_col,
+                           main_sum, word_multiplier, 0, depth)
 
-                new_node = start_node.children[letter]
-                new_rack = rack.copy()
-                if wildcard:
-                    new_word = word + letter + "%"
-                    new_rack.remove("%")
-                else:
-                    new_word = word + letter
-                    new_rack.remove(letter)
-                new_squares = squares + [potential_square]
-                self._left_part(new_node, anchor_square_row, anchor_square_col, new_rack, new_word, new_squares,
-                                limit - 1, dist_from_anchor + 1)
-
-    def _update_cross_checks(self):
-        while self.upper_cross_check:
-            curr_square, lower_letter, lower_row, lower_col = self.upper_cross_check.pop()
-            curr_square.check_switch(self.is_transpose)
-
-            # add to modifier for computing cross-sum
-            if self.is_transpose:
-                curr_square.modifier += f"-{self.point_dict[lower_letter]}"
+        if limit > 0:
+            for letter, new_node in start_node.children.items():
+                index = RACK_INDEX[letter]
+                if rack[index]:
+                    rack[index] -= 1
+                    self.path_letters[depth] = letter
+                    self.path_blanks[depth] = False
+                    self._left_part(new_node, anchor_square_row, anchor_square_col, rack, limit - 1, depth + 1)
+                    rack[index] += 1
+                elif rack[BLANK]:
+                    rack[BLANK] -= 1
+                    self.path_letters[depth] = letter
+                    self.path_blanks[depth] = True
+                    self._left_part(new_node, anchor_square_row, anchor_square_col, rack, limit - 1, depth + 1)
+                    rack[BLANK] += 1
+
+    # stop the search once it is past its deadline or cancelled
+    def _check_search(self):
+        self._calls_until_check = SEARCH_CHECK_INTERVAL
+        if self._deadline is not None and time.perf_counter() > self._deadline and \
+                (self._moves or not self._require_move) or \
+                self._cancel is not None and self._cancel.is_set():
+            raise _SearchStopped()
+
+    # compute the cross-check mask and cross-sum of the empty square at (row, col) from the word fragment
+    # running through it in direction (d_row, d_col): the letters X for which prefix + X + suffix is a word
+    def _fragment_cross_check(self, row, col, d_row, d_col):
+        prefix = []
+        curr_row, curr_col = row - d_row, col - d_col
+        while curr_row >= 0 and curr_col >= 0 and self.board[curr_row][curr_col].letter:
+            prefix.append(self.board[curr_row][curr_col])
+            curr_row, curr_col = curr_row - d_row, curr_col - d_col
+        prefix.reverse()
+
+        suffix = []
+        curr_row, curr_col = row + d_row, col + d_col
+        while curr_row < len(self.board) and curr_col < len(self.board[0]) and self.board[curr_row][curr_col].letter:
+            suffix.append(self.board[curr_row][curr_col])
+            curr_row, curr_col = curr_row + d_row, curr_col + d_col
+
+        if not prefix and not suffix:
+            return ALL_CROSS_CHECKS, 0
+
+        cross_sum = sum(square.tile_score for square in prefix + suffix)
+        node = self.dawg_root
+        for square in prefix:
+            node = node.children.get(square.letter)
+            if node is None:
+                return 0, cross_sum
+
+        valid_letters = 0
+        for letter, test_node in node.children.items():
+            for square in suffix:
+                test_node = test_node.children.get(square.letter)
+                if test_node is None:
+                    break
             else:
-                curr_square.modifier += f"+{self.point_dict[lower_letter]}"
-
-            chr_val = 65
-            # prevent cross stacking deeper than 2 layers
-            if curr_square.letter:
-                if not self.is_transpose:
-                    self.board[lower_row - 1][lower_col].cross_checks_0 = [0] * 26
-                    self.board[lower_row + 1][lower_col].cross_checks_0 = [0] * 26
-
-                else:
-                    self.board[lower_row - 1][lower_col].cross_checks_1 = [0] * 26
-                    self.board[lower_row + 1][lower_col].cross_checks_1 = [0] * 26
-                continue
-
-            for i, ind in enumerate(curr_square.cross_checks):
-                if ind == 1:
-                    test_node = self.dawg_root.children[chr(chr_val)]
-                    if (lower_letter not in test_node.children) or (not test_node.children[lower_letter].is_terminal):
-                        curr_square.cross_checks[i] = 0
-                chr_val += 1
-
-        while self.lower_cross_check:
-            curr_square, upper_letter, upper_row, upper_col = self.lower_cross_check.pop()
-            curr_square.check_switch(self.is_transpose)
-
-            # add to modifier for computing cross-sum
-            if self.is_transpose:
-                curr_square.modifier += f"-{self.point_dict[upper_letter]}"
+                if test_node.is_terminal:
+                    valid_letters |= LETTER_BITS[letter]
+        return valid_letters, cross_sum
+
+    # recompute cached cross-checks for the empty squares whose orthogonal fragments changed when tiles were
+    # placed at placed_squares. Squares at the ends of each vertical fragment constrain horizontal plays;
+    # squares at the ends of each horizontal fragment constrain vertical plays.
+    def _update_cross_checks(self, placed_squares):
+        num_rows, num_cols = len(self.board), len(self.board[0])
+
+        to_update = set()
+        for row, col in placed_squares:
+            for d_row, d_col, orientation in [(1, 0, HORIZONTAL), (0, 1, VERTICAL)]:
+                for step in (-1, 1):
+                    curr_row, curr_col = row, col
+                    while 0 <= curr_row < num_rows and 0 <= curr_col < num_cols and \
+                            self.board[curr_row][curr_col].letter:
+                        curr_row, curr_col = curr_row + step * d_row, curr_col + step * d_col
+                    if 0 <= curr_row < num_rows and 0 <= curr_col < num_cols:
+                        to_update.add((curr_row, curr_col, d_row, d_col, orientation))
+
+        for row, col in placed_squares:
+            self._line_bounds[HORIZONTAL][row] = None
+            self._line_bounds[VERTICAL][col] = None
+
+        for row, col, d_row, d_col, orientation in to_update:
+            self._line_bounds[HORIZONTAL][row] = None
+            self._line_bounds[VERTICAL][col] = None
+            square = self.board[row][col]
+            if self._delta is not None:
+                self._delta.cross_checks.append((row, col, orientation, square.cross_checks[orientation],
+                                                 square.cross_sums[orientation],
+                                                 square.cross_multipliers[orientation]))
+            square.cross_checks[orientation], square.cross_sums[orientation] = \
+                self._fragment_cross_check(row, col, d_row, d_col)
+            # the square is next to a new tile, so a tile placed on it always forms a cross-word
+            square.cross_multipliers[orientation] = self.premiums.word_lines[HORIZONTAL][row][col]
+
+        # the new tiles stop being anchors and the empty squares around them (all of which were just
+        # updated) may become anchors or lose every legal letter. These are the only squares that started
+        # touching a tile, so besides their own limits only the next anchor after each one can have a new limit.
+        changed_squares = set(placed_squares)
+        changed_squares.update((row, col) for row, col, _, _, _ in to_update)
+        for row, col in changed_squares:
+            self._refresh_anchor(row, col)
+        for row, col in changed_squares:
+            self._refresh_next_left_limit(HORIZONTAL, row, col)
+            self._refresh_next_left_limit(VERTICAL, col, row)
+
+    def _touches_tile(self, row, col):
+        return (row > 0 and self.board[row - 1][col].letter) or \
+            (row + 1 < len(self.board) and self.board[row + 1][col].letter) or \
+            (col > 0 and self.board[row][col - 1].letter) or \
+            (col + 1 < len(self.board[0]) and self.board[row][col + 1].letter)
+
+    def _refresh_anchor(self, row, col):
+        square = self.board[row][col]
+        touches_tile = not square.letter and self._touches_tile(row, col)
+        for orientation, key in [(HORIZONTAL, (row, col)), (VERTICAL, (col, row))]:
+            if touches_tile and square.cross_checks[orientation]:
+                self._set_anchor(orientation, key, self._left_limit(orientation, *key))
             else:
-                curr_square.modifier += f"+{self.point_dict[upper_letter]}"
-
-            chr_val = 65
-            # prevent cross stacking deeper than 2 layers
-            if curr_square.letter:
-                if not self.is_transpose:
-                    self.board[upper_row - 1][upper_col].cross_checks_0 = [0] * 26
-                    self.board[upper_row + 1][upper_col].cross_checks_0 = [0] * 26
-                else:
-                    self.board[upper_row - 1][upper_col].cross_checks_1 = [0] * 26
-                    self.board[upper_row + 1][upper_col].cross_checks_1 = [0] * 26
-                continue
-
-            for i, ind in enumerate(curr_square.cross_checks):
-                if ind == 1:
-                    test_node = self.dawg_root.children[upper_letter]
-                    if (chr(chr_val) not in test_node.children) or (not test_node.children[chr(chr_val)].is_terminal):
-                        curr_square.cross_checks[i] = 0
-                chr_val += 1
-
-    def _cross_check(self, letter, square):
-        square.check_switch(self.is_transpose)
-        chr_val = 65
-        for i, ind in enumerate(square.cross_checks):
-            if ind == 1:
-                if chr(chr_val) == letter:
-                    return True
-            chr_val += 1
-        return False
+                self._set_anchor(orientation, key, None)
+
+    # number of empty squares directly before position col of a line that touch no tile
+    def _left_limit(self, orientation, line_index, col):
+        line = self.lines[orientation][line_index]
+        limit = 0
+        while col - limit - 1 >= 0:
+            if orientation == HORIZONTAL:
+                row, curr_col = line_index, col - limit - 1
+            else:
+                row, curr_col = col - limit - 1, line_index
+            if line[col - limit - 1].letter or self._touches_tile(row, curr_col):
+                break
+            limit += 1
+        return limit
+
+    # recompute the left-part limit of the first anchor after position col of a line, which is the only one
+    # whose run of free squares can reach col
+    def _refresh_next_left_limit(self, orientation, line_index, col):
+        line = self.lines[orientation][line_index]
+        anchors = self.anchors[orientation]
+        for next_col in range(col + 1, len(line)):
+            key = (line_index, next_col)
+            if key in anchors:
+                self._set_anchor(orientation, key, self._left_limit(orientation, line_index, next_col))
+                return
+            if orientation == HORIZONTAL:
+                row, curr_col = line_index, next_col
+            else:
+                row, curr_col = next_col, line_index
+            if line[next_col].letter or self._touches_tile(row, curr_col):
+                return
 
     def print_board(self):
         print("    ", end="")
@@ -296,178 +706,324 @@ class ScrabbleBoard:
             print()
         print()
 
-    # method to insert words into board by row and column number
+    # method to insert words into board by row and column number, reading down the column if vertical.
+    # blanks holds the indices of word that are played with blank tiles
     # using 1-based indexing for user input
-    def insert_word(self, row, col, word):
-        if len(word) + col > self.board_params.num_cols:
+    def insert_word(self, row, col, word, vertical=False, blanks=()):
+        if vertical:
+            line, start_col = self.columns[col], row
+        else:
+            line, start_col = self.board[row], col
+        if len(word) + start_col > len(line):
             print(f'Cannot insert word "{word}" at column {col + 1}, '
                   f'row {row + 1} not enough space')
-            return
-        curr_col = col
-        modifiers = []
-        for i, letter in enumerate(word):
-            curr_square_letter = self.board[row][curr_col].letter
-            modifiers.append(self.board[row][curr_col].modifier)
-            # if current square already has a letter in it, check to see if it's the same letter as
-            # the one we're trying to insert. If not, insertion fails, undo any previous insertions
-            if curr_square_letter:
-                if curr_square_letter == letter:
-                    if row > 0:
-                        self.upper_cross_check.append((self.board[row - 1][curr_col], letter, row, curr_col))
-                    if row < self.board_params.num_rows-1:
-                        self.lower_cross_check.append((self.board[row + 1][curr_col], letter, row, curr_col))
-
-                    curr_col += 1
-                else:
-                    print(f'Failed to insert letter "{letter}" of "{word}" at column {curr_col + 1}, '
-                          f'row {row + 1}. Square is occupied by letter "{curr_square_letter}"')
-                    self.upper_cross_check = []
-                    self.lower_cross_check = []
-                    for _ in range(i):
-                        curr_col -= 1
-                        self.board[row][curr_col].letter = None
-                        self.board[row][curr_col].modifier = modifiers.pop()
-                    return
-            else:
-                self.board[row][curr_col].letter = letter
+            return False
 
-                # reset any modifiers to 0 once they have a tile placed on top of them
-                self.board[row][curr_col].modifier = ""
+        # if a square already has a letter in it, it must be the same letter as the one we're trying to insert
+        for letter, curr_square in zip(word, line[start_col:]):
+            if curr_square.letter and curr_square.letter != letter:
+                print(f'Failed to insert letter "{letter}" of "{word}" at column {col + 1}, '
+                      f'row {row + 1}. Square is occupied by letter "{curr_square.letter}"')
+                return False
 
-                # once letter is inserted, add squares above and below it to cross_check_queue
-                if row > 0:
-                    self.upper_cross_check.append((self.board[row - 1][curr_col], letter, row, curr_col))
-                if row < self.board_params.num_rows-1:
-                    self.lower_cross_check.append((self.board[row + 1][curr_col], letter, row, curr_col))
-
-                curr_col += 1
-
-        # place 0 cross-check sentinel at the beginning and end of inserted words to stop accidental overlap.
-        # sentinels should only be for the board state opposite from the one the board is currently in
-        if curr_col < self.board_params.num_cols:
-            if self.is_transpose:
-                self.board[self.best_row][curr_col].cross_checks_0 = [0] * 26
+        placed_squares = []
+        for i, letter in enumerate(word):
+            curr_square = line[start_col + i]
+            if curr_square.letter:
+                continue
+            if vertical:
+                square_row, square_col = start_col + i, col
             else:
-                self.board[self.best_row][curr_col].cross_checks_1 = [0] * 26
-        if col - 1 > - 1:
-            if self.is_transpose:
-                self.board[self.best_row][col - 1].cross_checks_0 = [0] * 26
+                square_row, square_col = row, start_col + i
+            placed_squares.append((square_row, square_col))
+            curr_square.letter = letter
+            curr_square.is_blank = i in blanks
+            curr_square.tile_score = 0 if curr_square.is_blank else self.point_dict[letter]
+            tile = ord(letter) - 65 + 26 * curr_square.is_blank
+            self.zobrist_hash ^= self._zobrist_keys[square_row][square_col][tile]
+
+            # stop drawing the modifier once a tile is placed on top of it
+            curr_square.modifier = ""
+
+        if self._delta is not None:
+            self._delta.placed_squares = placed_squares
+
+        # the start square only anchors the first play
+        self._set_anchor(HORIZONTAL, (self.board_params.start_row, self.board_params.start_col), None)
+
+        # only the empty squares next to the new tiles can have new cross-checks
+        self._update_cross_checks(placed_squares)
+        return True
+
+    # play move on the board and return a MoveDelta that unmake_move takes it back with. Raises ValueError if
+    # the move doesn't fit the board.
+    def make_move(self, move):
+        delta = self._delta = MoveDelta(move, self.zobrist_hash)
+        try:
+            if not self.insert_word(move.row, move.col, move.word, vertical=move.vertical, blanks=move.blanks):
+                raise ValueError(f"{move} does not fit the board")
+        finally:
+            self._delta = None
+        return delta
+
+    # the Zobrist hash the board would have after move, without playing it
+    def hash_after(self, move):
+        if move.vertical:
+            line, start, col = self.columns[move.col], move.row, move.col
+        else:
+            line, start, row = self.board[move.row], move.col, move.row
+        board_hash = self.zobrist_hash
+        for i, letter in enumerate(move.word):
+            if line[start + i].letter:
+                continue
+            if move.vertical:
+                row = start + i
             else:
-                self.board[self.best_row][col - 1].cross_checks_1 = [0] * 26
-
-        self._update_cross_checks()
-
-        self.words_on_board.append(word)
+                col = start + i
+            board_hash ^= self._zobrist_keys[row][col][ord(letter) - 65 + 26 * (i in move.blanks)]
+        return board_hash
+
+    # take back the last move made with make_move. Only restores what the move changed, so it takes time in
+    # proportion to the number of tiles placed.
+    def unmake_move(self, delta):
+        for orientation, key, limit in reversed(delta.anchors):
+            if limit is None:
+                self.anchors[orientation].pop(key, None)
+            else:
+                self.anchors[orientation][key] = limit
+
+        for row, col, orientation, cross_checks, cross_sum, cross_multiplier in reversed(delta.cross_checks):
+            square = self.board[row][col]
+            square.cross_checks[orientation] = cross_checks
+            square.cross_sums[orientation] = cross_sum
+            square.cross_multipliers[orientation] = cross_multiplier
+            self._line_bounds[HORIZONTAL][row] = None
+            self._line_bounds[VERTICAL][col] = None
+
+        for row, col in delta.placed_squares:
+            square = self.board[row][col]
+            square.letter = None
+            square.is_blank = False
+            square.tile_score = 0
+            square.modifier = self.premiums.modifiers[row][col]
+            self._line_bounds[HORIZONTAL][row] = None
+            self._line_bounds[VERTICAL][col] = None
+
+        self.zobrist_hash = delta.zobrist_hash
+
+    # set or, with limit None, remove an anchor, recording the old limit when a move is being made
+    def _set_anchor(self, orientation, key, limit):
+        anchors = self.anchors[orientation]
+        if self._delta is not None:
+            self._delta.anchors.append((orientation, key, anchors.get(key)))
+        if limit is None:
+            anchors.pop(key, None)
+        else:
+            anchors[key] = limit
 
-    # gets all words that can be made using a selected filled square and the current word rack
+    # gets all words that can be made through an anchor square and the current word rack,
+    # given as tile counts (see rack.py)
     def get_all_words(self, square_row, square_col, rack):
-
-        # get all words that start with the filled letter
-        self._extend_right(self.dawg_root, square_row, square_col, rack, "", [], 0)
-
-        # create anchor square only if the space is empty
-        if self.board[square_row][square_col - 1].letter:
+        line = self.lines[self.orientation][square_row]
+
+        # tiles directly left of the anchor are a fixed left part
+        if square_col > 0 and line[square_col - 1].letter:
+            start_col = square_col
+            while start_col > 0 and line[start_col - 1].letter:
+                start_col -= 1
+            node = self.dawg_root
+            for depth in range(square_col - start_col):
+                letter = line[start_col + depth].letter
+                node = node.children.get(letter)
+                if node is None:
+                    return
+                self.path_letters[depth] = letter
+                self.path_blanks[depth] = line[start_col + depth].is_blank
+            main_sum = sum(square.tile_score for square in line[start_col:square_col])
+            self._extend_right(node, square_row, square_col, rack, square_col - start_col, square_col,
+                               main_sum, 1, 0, 0)
             return
 
-        # try every letter in rack as possible anchor square
-        for i, letter in enumerate(rack):
-            # Only allow anchor square with trivial cross-checks
-            potential_square = self.board[square_row][square_col - 1]
-            potential_square.check_switch(self.is_transpose)
-            if 0 in potential_square.cross_checks or potential_square.letter:
-                continue
-            temp_rack = rack[:i] + rack[i + 1:]
-            self.board[square_row][square_col - 1].letter = letter
-            self._left_part(self.dawg_root, square_row, square_col - 1, temp_rack, "", [], 6, 1)
-
-        # reset anchor square spot to blank after trying all combinations
-        self.board[square_row][square_col - 1].letter = None
-
-    # scan all tiles on board in both transposed and non-transposed state, find best move
-    def get_best_move(self, word_rack):
+        # otherwise rack tiles may be placed on the empty squares to the left that don't touch any tile,
+        # since plays covering those are generated from their own anchors. One tile is kept for the anchor.
+        limit = min(self.anchors[self.orientation][(square_row, square_col)], sum(rack) - 1)
+        self._left_part(self.dawg_root, square_row, square_col, rack, limit, 0)
+
+    # every anchor as (orientation, line, position), along rows and then along columns.
+    # lines restricts them to the given (orientation, line) pairs
+    def _anchor_order(self, lines=None):
+        return [(orientation, row, col) for orientation, anchors in enumerate(self.anchors)
+                for row, col in sorted(anchors) if lines is None or (orientation, row) in lines]
+
+    # the (orientation, line) pairs that have anchors, in search order
+    def anchor_lines(self):
+        return sorted({(orientation, row) for orientation, anchors in enumerate(self.anchors) for row, col in anchors})
+
+    # moves that can be played with the given rack of letters. With k, returns a list of the k best moves, best
+    # first, keeping only those k while searching. Without k, returns a generator over every move, produced one
+    # anchor at a time; the board must not be changed until it is exhausted.
+    # prune only applies with k: anchors are searched in order of the most their plays can score, stopping once
+    # that is too little to make the k best. The result is the same.
+    # lines limits the search to the anchors on the given (orientation, line) pairs, see anchor_lines.
+    # With a position_cache, searches for k moves over the whole board are looked up there first.
+    def generate_moves(self, rack, k=None, prune=False, lines=None):
+        if lines is not None:
+            lines = set(lines)
+        if k is None:
+            return self._stream_moves(rack, lines)
+        if self.position_cache is None or lines is not None:
+            return self._search(rack, k, prune, lines)
+
+        leave_table = self.leave_values.path if self.leave_values is not None else None
+        key = (self.zobrist_hash, "".join(sorted(rack)), self.layout_id, k, leave_table)
+        moves = self.position_cache.get(key)
+        if moves is None:
+            moves = tuple(self._search(rack, k, prune, lines))
+            self.position_cache.put(key, moves)
+        return list(moves)
+
+    # look up the leave values of the plays from rack before searching for them
+    def _start_search(self, rack):
+        if self.leave_values is None:
+            self._leave_values = None
+            self._max_leave_value = 0
+        else:
+            self._leave_values = self.leave_values.for_rack(rack)
+            self._max_leave_value = max(self._leave_values.values(), default=0)
+
+    def _search(self, rack, k, prune, lines):
+        self._start_search(rack)
+        self._moves = []
+        self._top_k = k
+        self._min_score = 0
+        if k > 0:
+            counts = rack_counts(rack)
+            if prune:
+                self._search_pruned(rack, counts, lines)
+            else:
+                for orientation, row, col in self._anchor_order(lines):
+                    self.orientation = orientation
+                    self.get_all_words(row, col, counts)
+        return sorted(self._moves, reverse=True)
+
+    def _search_pruned(self, rack, counts, lines):
+        # search the anchors with the highest bound first and stop once the rest can't reach the k best
+        for bound, orientation, row, col in self._anchors_by_bound(rack, lines):
+            if bound < self._min_score:
+                break
+            self.orientation = orientation
+            self.get_all_words(row, col, counts)
+
+    # every anchor as (the most its plays can score, orientation, line, position), highest bound first
+    def _anchors_by_bound(self, rack, lines):
+        for orientation, line_bounds in enumerate(self._line_bounds):
+            for line_index, bounds in enumerate(line_bounds):
+                if bounds is None:
+                    line_bounds[line_index] = LineBounds(self.lines[orientation][line_index],
+                                                         self.premiums.letter_lines[orientation][line_index],
+                                                         self.premiums.word_lines[orientation][line_index],
+                                                         orientation)
+        self._tile_values = {}
+        self._rack_size = len(rack)
+        self._rack_values = sorted((self.point_dict[letter] for letter in rack), reverse=True)
+        self._rack_letters = set(rack) - {"%"}
+        self._has_blank = "%" in rack
+        if not rack:
+            return []
+
+        anchor_bounds = []
+        for orientation, row, col in self._anchor_order(lines):
+            self._check_search()
+            self.orientation = orientation
+            anchor_bounds.append((self._anchor_bound(row, col), orientation, row, col))
+        anchor_bounds.sort(key=lambda anchor: -anchor[0])
+        return anchor_bounds
+
+    def _stream_moves(self, rack, lines):
+        self._start_search(rack)
+        rack = rack_counts(rack)
+        for orientation, row, col in self._anchor_order(lines):
+            moves = self._moves = []
+            self._top_k = None
+            self._min_score = 0
+            self.orientation = orientation
+            self.get_all_words(row, col, rack)
+            yield from moves
+
+    # find best move and play it, returns the tiles left on the rack. prune searches with upper bounds,
+    # see generate_moves
+    def get_best_move(self, word_rack, prune=False):
+        moves = self.generate_moves(word_rack, k=1, prune=prune)
+        return self.play_move(moves[0] if moves else None, word_rack)
+
+    # the k best moves of rack, like generate_moves, found within time_limit seconds and before cancel (anything
+    # with is_set, such as a threading.Event) is set. Anchors are searched highest bound first, so stopping early
+    # leaves the best moves of the anchors most likely to hold them. Returns the moves found, best first, and
+    # whether the search completed, in which case they are the same as generate_moves'. The deadline and
+    # cancellation are checked every SEARCH_CHECK_INTERVAL steps of the search. With require_move, the search
+    # goes on past the deadline until it finds a move, so it only returns none when there is none or it was
+    # cancelled.
+    def search_best_moves(self, rack, k=1, time_limit=None, cancel=None, prune=False, require_move=False):
+        if time_limit is not None:
+            self._deadline = time.perf_counter() + time_limit
+        self._cancel = cancel
+        self._require_move = require_move
+        self._calls_until_check = 1
+        self._start_search(rack)
+        self._moves = []
+        self._top_k = k
+        self._min_score = 0
+        completed = True
+        try:
+            if k > 0:
+                counts = rack_counts(rack)
+                for bound, orientation, row, col in self._anchors_by_bound(rack, None):
+                    if prune and bound < self._min_score:
+                        break
+                    self._check_search()
+                    self.orientation = orientation
+                    self.get_all_words(row, col, counts)
+        except _SearchStopped:
+            completed = False
+        finally:
+            self._deadline = None
+            self._cancel = None
+            self._require_move = False
+        return sorted(self._moves, reverse=True), completed
+
+    # get_best_move within time_limit seconds and before cancel is set, see search_best_moves. Plays the best move
+    # found and returns the tiles left on the rack and whether the search completed.
+    def get_best_move_within(self, word_rack, time_limit=None, cancel=None, prune=False, require_move=False):
+        moves, completed = self.search_best_moves(word_rack, 1, time_limit, cancel, prune, require_move)
+        return self.play_move(moves[0] if moves else None, word_rack), completed
+
+    # play a move found for word_rack, None if there is none, and return the tiles left on the rack
+    def play_move(self, move, word_rack):
 
         self.word_rack = word_rack
 
-        # clear out cross-check lists before adding new words
-        self._update_cross_checks()
-
         # reset word variables to clear out words from previous turns
+        self.best_move = None
         self.best_word = ""
         self.highest_score = 0
-        self.best_row = 0
-        self.best_col = 0
-
-        transposed = False
-        for row in range(0, self.board_params.num_rows):
-            for col in range(0, self.board_params.num_cols):
-                curr_square = self.board[row][col]
-                if curr_square.letter:
-                    if ((col > 0) and (not self.board[row][col - 1].letter)) or col == 0:
-                        prev_best_score = self.highest_score
-                        self.get_all_words(row, col, word_rack)
-                        if self.highest_score > prev_best_score:
-                            self.best_row = row
-                            self.best_col = col
-
-        self._transpose()
-        for row in range(0, self.board_params.num_cols):
-            for col in range(0, self.board_params.num_rows):
-                curr_square = self.board[row][col]
-                if curr_square.letter:
-                    if ((col > 0) and (not self.board[row][col - 1].letter)) or col == 0:
-                        prev_best_score = self.highest_score
-                        self.get_all_words(row, col, word_rack)
-                        if self.highest_score > prev_best_score:
-                            transposed = True
-                            self.best_row = row
-                            self.best_col = col
 
         # Don't try to insert word if we couldn't find one
-        if not self.best_word:
-            self._transpose()
+        if move is None:
             return word_rack
 
-        if transposed:
-            self.insert_word(self.best_row, self.best_col - self.dist_from_anchor, self.best_word)
-            self._transpose()
-        else:
-            self._transpose()
-            self.insert_word(self.best_row, self.best_col - self.dist_from_anchor, self.best_word)
+        self.best_move = move
+        self.best_word = move.word
+        self.highest_score = move.score
+        self.insert_word(move.row, move.col, move.word, vertical=move.vertical, blanks=move.blanks)
 
         self.word_score_dict[self.best_word] = self.highest_score
 
-        for letter in self.letters_from_rack:
+        for letter in move.tiles:
             if letter in word_rack:
                 word_rack.remove(letter)
 
         return word_rack
 
+    # the start square is the only anchor on an empty board, so the first move is an ordinary search
     def get_start_move(self, word_rack):
-        # board symmetrical at start so just always play the start move horizontally
-        # try every letter in rack as possible anchor square
-        # TODO: get if from board params
-        self.best_row = self.board_params.start_row
-        self.best_col = self.board_params.start_col
-        for i, letter in enumerate(word_rack):
-            potential_square = self.board[self.best_row][self.best_col]
-            temp_rack = word_rack[:i] + word_rack[i + 1:]
-            potential_square.letter = letter
-            self._left_part(self.dawg_root, self.best_row, self.best_col, temp_rack, "", [], self.best_col-1, 1)
-
-        # reset anchor square spot to blank after trying all combinations
-        self.board[self.best_row][self.best_col].letter = None
-        self.insert_word(self.best_row + 1, self.best_col + 1 - self.dist_from_anchor, self.best_word)
-        self.board[self.best_row][self.best_col].modifier = ""
-        self.word_score_dict[self.best_word] = self.highest_score
-
-        for letter in self.letters_from_rack:
-            if letter in word_rack:
-                word_rack.remove(letter)
-
-        return word_rack
-
-
-
-
-
-
+        return self.get_best_move(word_rack)
@@ -0,0 +1,205 @@
+import sys
+
+from dawg import load_or_build_dawg, read_lexicon
+from board import ALL_CROSS_CHECKS, HORIZONTAL, LETTER_BITS, VERTICAL, LineBounds
+from rack import rack_counts
+from session import GameSession, parse_tests_file, parse_test_cases
+
+
+# Checks the board state that make_move keeps up to date incrementally and that the searches rely on, over every
+# position of a C2.txt case as played by GameSession:
+#   - the cross-checks, anchors, left-part limits, line bounds and Zobrist hash match the values recomputed from
+#     the tiles on the board, before and after each of the top moves is made
+#   - unmake_move restores exactly the state make_move started from, and hash_after predicts the hash
+#   - the top k and the pruned searches return the k best moves of the exhaustive move stream
+#   - no anchor's bound is below the score of a play through it
+# Run it after changing _update_cross_checks, _refresh_anchor, _refresh_next_left_limit, unmake_move,
+# LineBounds or _anchor_bound. Prints each failure and exits with status 1 if there was any.
+
+
+# everything make_move changes and unmake_move restores
+def board_state(game):
+    squares = [(square.letter, square.is_blank, square.tile_score, tuple(square.cross_checks),
+                tuple(square.cross_sums), tuple(square.cross_multipliers), square.modifier)
+               for row in game.board for square in row]
+    return squares, [dict(anchors) for anchors in game.anchors], game.zobrist_hash
+
+
+# the letters that may be placed on each empty square, the cross-sum and multiplier of the word they form, the
+# anchors with their left-part limits and the Zobrist hash, recomputed from the tiles on the board with the word
+# list. Also returns the tiles whose score doesn't match their letter.
+def expected_state(game, words):
+    board = game.board
+    num_rows, num_cols = len(board), len(board[0])
+
+    def occupied(row, col):
+        return 0 <= row < num_rows and 0 <= col < num_cols and board[row][col].letter
+
+    def touches_tile(row, col):
+        return any(occupied(row + d_row, col + d_col) for d_row, d_col in [(-1, 0), (1, 0), (0, -1), (0, 1)])
+
+    cross_checks = {}
+    tile_scores = []
+    zobrist_hash = 0
+    for row in range(num_rows):
+        for col in range(num_cols):
+            square = board[row][col]
+            if square.letter:
+                if square.tile_score != (0 if square.is_blank else game.point_dict[square.letter]):
+                    tile_scores.append((row, col))
+                tile = ord(square.letter) - 65 + 26 * square.is_blank
+                zobrist_hash ^= game._zobrist_keys[row][col][tile]
+                continue
+            # horizontal plays are constrained by the word running down through the square, vertical plays by
+            # the one running across it
+            for orientation, d_row, d_col in [(HORIZONTAL, 1, 0), (VERTICAL, 0, 1)]:
+                prefix = []
+                curr_row, curr_col = row - d_row, col - d_col
+                while occupied(curr_row, curr_col):
+                    prefix.insert(0, board[curr_row][curr_col])
+                    curr_row, curr_col = curr_row - d_row, curr_col - d_col
+                suffix = []
+                curr_row, curr_col = row + d_row, col + d_col
+                while occupied(curr_row, curr_col):
+                    suffix.append(board[curr_row][curr_col])
+                    curr_row, curr_col = curr_row + d_row, curr_col + d_col
+                if not prefix and not suffix:
+                    cross_checks[(row, col, orientation)] = (ALL_CROSS_CHECKS, 0, 0)
+                    continue
+                before = "".join(square.letter for square in prefix)
+                after = "".join(square.letter for square in suffix)
+                mask = 0
+                for letter, bit in LETTER_BITS.items():
+                    if before + letter + after in words:
+                        mask |= bit
+                cross_checks[(row, col, orientation)] = (mask, sum(square.tile_score for square in prefix + suffix),
+                                                         game.premiums.word_lines[HORIZONTAL][row][col])
+
+    anchors = [{}, {}]
+    if not any(square.letter for line in board for square in line):
+        anchors[HORIZONTAL][(game.board_params.start_row, game.board_params.start_col)] = game.board_params.start_col
+    else:
+        for orientation, lines in enumerate(game.lines):
+            for line_index, line in enumerate(lines):
+                for col in range(len(line)):
+                    row_col = (line_index, col) if orientation == HORIZONTAL else (col, line_index)
+                    if line[col].letter or not touches_tile(*row_col) or \
+                            not cross_checks[(*row_col, orientation)][0]:
+                        continue
+                    limit = 0
+                    while col - limit - 1 >= 0:
+                        before_col = col - limit - 1
+                        before = (line_index, before_col) if orientation == HORIZONTAL else (before_col, line_index)
+                        if line[before_col].letter or touches_tile(*before):
+                            break
+                        limit += 1
+                    anchors[orientation][(line_index, col)] = limit
+    return cross_checks, anchors, zobrist_hash, tile_scores
+
+
+# the failures found comparing the board's incrementally kept state with expected_state
+def state_failures(game, words):
+    cross_checks, anchors, zobrist_hash, tile_scores = expected_state(game, words)
+    failures = [f"tile score of {row},{col} is {game.board[row][col].tile_score}" for row, col in tile_scores]
+    for (row, col, orientation), (mask, cross_sum, multiplier) in cross_checks.items():
+        square = game.board[row][col]
+        found = (square.cross_checks[orientation], square.cross_sums[orientation],
+                 square.cross_multipliers[orientation])
+        if found != (mask, cross_sum, multiplier):
+            failures.append(f"cross-check of {row},{col} orientation {orientation}: {found}, expected "
+                            f"{(mask, cross_sum, multiplier)}")
+    for orientation in (HORIZONTAL, VERTICAL):
+        if game.anchors[orientation] != anchors[orientation]:
+            failures.append(f"anchors of orientation {orientation}: {sorted(game.anchors[orientation].items())}, "
+                            f"expected {sorted(anchors[orientation].items())}")
+    if game.zobrist_hash != zobrist_hash:
+        failures.append(f"Zobrist hash {game.zobrist_hash:x}, expected {zobrist_hash:x}")
+
+    # line bounds still cached must match the line as it is now
+    for orientation, line_bounds in enumerate(game._line_bounds):
+        for line_index, bounds in enumerate(line_bounds):
+            if bounds is None:
+                continue
+            expected = LineBounds(game.lines[orientation][line_index],
+                                  game.premiums.letter_lines[orientation][line_index],
+                                  game.premiums.word_lines[orientation][line_index], orientation)
+            if vars(bounds) != vars(expected):
+                failures.append(f"stale line bounds of line {line_index} orientation {orientation}")
+    return failures
+
+
+def _move_keys(moves):
+    return [(move.row, move.col, move.vertical, move.word, tuple(move.blanks), move.score) for move in moves]
+
+
+# the failures found searching the position of game with word_rack in each of the ways the searches can run
+def search_failures(game, word_rack, k):
+    failures = []
+    every_move = list(game.generate_moves(word_rack))
+    expected = _move_keys(sorted(every_move, reverse=True)[:k])
+    for prune in (False, True):
+        found = _move_keys(game.generate_moves(word_rack, k, prune))
+        if found != expected:
+            failures.append(f"top {k} moves with prune={prune} differ from the exhaustive search: {found}, "
+                            f"expected {expected}")
+
+    # the bound of every anchor against the best play the exhaustive search finds through it
+    game._anchors_by_bound(word_rack, None)
+    counts = rack_counts(word_rack)
+    for orientation, row, col in game._anchor_order():
+        game.orientation = orientation
+        bound = game._anchor_bound(row, col)
+        game._moves = []
+        game._top_k = None
+        game._min_score = 0
+        game.get_all_words(row, col, counts)
+        best_score = max((move.score for move in game._moves), default=-1)
+        if bound < best_score:
+            failures.append(f"bound {bound} of anchor {row},{col} orientation {orientation} is below the "
+                            f"score {best_score} of a play through it")
+    return failures
+
+
+# make and unmake each of the top num_moves moves, checking the state after each against expected_state and
+# that unmake_move restores it exactly
+def make_unmake_failures(game, word_rack, words, num_moves):
+    failures = []
+    before = board_state(game)
+    for move in game.generate_moves(word_rack, num_moves):
+        predicted_hash = game.hash_after(move)
+        delta = game.make_move(move)
+        failures.extend(f"after {move}: {failure}" for failure in state_failures(game, words))
+        if game.zobrist_hash != predicted_hash:
+            failures.append(f"hash_after({move}) is {predicted_hash:x}, make_move gave {game.zobrist_hash:x}")
+        game.unmake_move(delta)
+        if board_state(game) != before:
+            failures.append(f"unmake_move of {move} did not restore the board")
+    return failures
+
+
+def check_board(lexicon_path="dictionary.txt", tests_path="C2.txt", case_number=2, k=10, num_moves=5):
+    root = load_or_build_dawg(lexicon_path)
+    words = set(read_lexicon(lexicon_path))
+    test_case = [case for case in parse_test_cases(parse_tests_file(tests_path)) if case[0] == case_number][0]
+    session = GameSession(root, test_case[2], test_case[1])
+
+    num_failures = 0
+    num_positions = 0
+    while not session.over:
+        game, word_rack = session.game, session.word_rack
+        failures = state_failures(game, words) + search_failures(game, word_rack, k) + \
+            make_unmake_failures(game, word_rack, words, num_moves)
+        for failure in failures:
+            print(f"turn {len(session.turns) + 1}: {failure}")
+        num_failures += len(failures)
+        num_positions += 1
+        session.play_turn()
+
+    print(f"checked {num_positions} positions of case {case_number}, {num_failures} failures")
+    return num_failures == 0
+
+
+if __name__ == "__main__":
+    sys.setrecursionlimit(10000)
+    if not check_board():
+        sys.exit(1)
@@ -1,4 +1,10 @@
+import array
+import hashlib
 import pickle
+import struct
+import sys
+
+from artifact import ArtifactError, MappedArtifact, write_artifact
 
 
 def build_trie(lexicon):
@@ -48,6 +54,16 @@ class Node:
         self.id = Node.next_id
         Node.next_id += 1
         self.children = {}
+        self.signature = None
+
+    # compute the minimization key once all children are minimized. the node must not change afterwards
+    def freeze(self):
+        signature = [self.is_terminal]
+        for letter, child in self.children.items():
+            signature.append(letter)
+            signature.append(child.id)
+        self.signature = tuple(signature)
+        return self.signature
 
     def __str__(self):
         out = [f"Node {self.id}\nChildren:\n"]
@@ -93,11 +109,13 @@ def minimize(curr_node, common_prefix_length, minimized_nodes, non_minimized_nod
 
         parent, letter, child = non_minimized_nodes.pop()
 
-        if child in minimized_nodes:
-            parent.children[letter] = minimized_nodes[child]
+        # minimized_nodes is keyed by frozen signature tuples, which hash without building strings
+        signature = child.freeze()
+        if signature in minimized_nodes:
+            parent.children[letter] = minimized_nodes[signature]
 
         else:
-            minimized_nodes[child] = child
+            minimized_nodes[signature] = child
 
         curr_node = parent
 
@@ -107,7 +125,7 @@ def minimize(curr_node, common_prefix_length, minimized_nodes, non_minimized_nod
 # function to build dawg from given lexicon
 def build_dawg(lexicon):
     root = Node()
-    minimized_nodes = {root: root}
+    minimized_nodes = {root.freeze(): root}
     non_minimized_nodes = []
     curr_node = root
     prev_word = ""
@@ -133,7 +151,8 @@ def build_dawg(lexicon):
         #     print(i)
 
     minimize(curr_node, 0, minimized_nodes, non_minimized_nodes)
-    print(len(minimized_nodes))
+    # on stderr, so tools writing results to stdout (such as batch.py) aren't interrupted by a first build
+    print(len(minimized_nodes), file=sys.stderr)
     return root
 
 
@@ -150,6 +169,215 @@ def find_in_dawg(word, curr_node):
         return False
 
 
+# On-disk DAWG artifact. The minimized graph is packed into a single edge table in the
+# Appel-Jacobson layout so it can be memory-mapped by every worker instead of rebuilt on
+# each launch.
+#
+# Layout (little-endian):
+#   header  magic, format version, flags, sha256 of source word list, index of the
+#           root's edge list, edge count, crc32 of the edge table
+#   edges   uint32 * num_edges. A node is the index of its first edge; its edges run
+#           until one has the end-of-list bit set. Entry 0 is reserved so that a
+#           target of 0 means the child has no edges.
+#
+# Each edge packs its letter (0-25), whether the child ends a word, the end-of-list
+# bit and the child's edge list index.
+DAWG_MAGIC = b"DAWG"
+DAWG_FORMAT_VERSION = 2
+_HEADER = struct.Struct("<4sHH32sIII")
+_ROOT_IS_TERMINAL = 1
+
+EDGE_LETTER_MASK = 0x1f
+EDGE_TERMINAL = 1 << 5
+EDGE_END_OF_LIST = 1 << 6
+EDGE_TARGET_SHIFT = 7
+# the bits of an edge that identify its child node
+_NODE_MASK = ~(EDGE_LETTER_MASK | EDGE_END_OF_LIST) & 0xffffffff
+
+_LETTERS = [chr(65 + i) for i in range(26)]
+
+# nodes a PackedDawg keeps decoded children for, see PackedDawg
+DEFAULT_CACHED_LISTS = 16384
+
+
+class DawgArtifactError(ArtifactError):
+    pass
+
+
+# returns sha256 digest identifying a word list file
+def lexicon_digest(lexicon_path):
+    with open(lexicon_path, "rb") as file:
+        return hashlib.sha256(file.read()).digest()
+
+
+def read_lexicon(lexicon_path):
+    with open(lexicon_path, "r") as file:
+        return [word.strip().upper() for word in file if word.strip()]
+
+
+# pack a Node graph into an edge table. Children are laid out before their parents, and
+# nodes that differ only in their terminal flag share one edge list.
+def pack_dawg(root):
+    edges = array.array("I", [0])
+    list_index = {}
+    shared_lists = {}
+    stack = [(root, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if id(node) in list_index:
+            continue
+        if not expanded:
+            stack.append((node, True))
+            stack.extend((child, False) for child in node.children.values() if id(child) not in list_index)
+            continue
+
+        packed = []
+        for letter, child in sorted(node.children.items()):
+            letter_index = ord(letter) - 65
+            if not 0 <= letter_index < 26:
+                raise ValueError(f"Cannot pack letter {letter!r}, only A-Z are supported")
+            edge = letter_index | (list_index[id(child)] << EDGE_TARGET_SHIFT)
+            if child.is_terminal:
+                edge |= EDGE_TERMINAL
+            packed.append(edge)
+        if not packed:
+            list_index[id(node)] = 0
+            continue
+        packed[-1] |= EDGE_END_OF_LIST
+        key = tuple(packed)
+        if key not in shared_lists:
+            shared_lists[key] = len(edges)
+            edges.extend(packed)
+        list_index[id(node)] = shared_lists[key]
+
+    return edges, list_index[id(root)]
+
+
+# pack a Node graph and write it atomically to path
+def compile_dawg(root, path, source_digest):
+    edges, root_index = pack_dawg(root)
+    flags = _ROOT_IS_TERMINAL if root.is_terminal else 0
+    write_artifact(path, _HEADER, DAWG_MAGIC, DAWG_FORMAT_VERSION, (flags, source_digest, root_index, len(edges)),
+                   edges)
+
+
+# read-only node over a packed edge table. Exposes the same children/is_terminal API as Node. children is a
+# plain slot, so a search reads it as fast as Node's: it is only unset until the node's PackedDawg decodes it,
+# and again after the PackedDawg drops its decoded lists.
+class PackedNode:
+    __slots__ = ("dawg", "id", "is_terminal", "children")
+
+    def __init__(self, dawg, index, is_terminal):
+        self.dawg = dawg
+        self.id = index
+        self.is_terminal = is_terminal
+
+    # only called while children is unset
+    def __getattr__(self, name):
+        if name != "children":
+            raise AttributeError(name)
+        return self.dawg.decode(self)
+
+    def __repr__(self):
+        out = ["1" if self.is_terminal else "0"]
+        for key, val in self.children.items():
+            out.append(key)
+            out.append(str(val.id))
+        return "_".join(out)
+
+
+# a memory-mapped DAWG artifact. Child lists are decoded from the edge table on first access, and child nodes are
+# shared by edge list index and terminal flag, so nodes reached by different paths are decoded once. At most
+# max_cached_lists nodes keep decoded children: when that many are decoded they are all dropped, which bounds the
+# heap a long-running worker holds whatever it searches.
+class PackedDawg:
+    def __init__(self, path, expected_digest=None, max_cached_lists=DEFAULT_CACHED_LISTS):
+        self._artifact = MappedArtifact(path, _HEADER, DAWG_MAGIC, DAWG_FORMAT_VERSION, "DAWG artifact",
+                                        DawgArtifactError)
+        flags, digest, root_index, num_edges = self._artifact.fields
+        if expected_digest is not None and digest != expected_digest:
+            raise DawgArtifactError(f"{path} was built from a different word list")
+        if root_index >= max(num_edges, 1):
+            raise DawgArtifactError(f"{path} has the wrong size")
+        self.edges = self._artifact.values("I", num_edges)
+        self.digest = digest
+        self.num_edges = num_edges
+        self.max_cached_lists = max_cached_lists
+        self.decoded_nodes = []
+        self._nodes = {}
+        self.root = PackedNode(self, root_index, bool(flags & _ROOT_IS_TERMINAL))
+
+    # decode node's edge list into its children, a dict of letter to PackedNode, and return them
+    def decode(self, node):
+        if len(self.decoded_nodes) >= self.max_cached_lists:
+            for decoded in self.decoded_nodes:
+                del decoded.children
+            self.decoded_nodes.clear()
+            self._nodes.clear()
+
+        children = {}
+        if node.id:
+            edges = self.edges
+            nodes = self._nodes
+            edge_index = node.id
+            while True:
+                edge = edges[edge_index]
+                key = edge & _NODE_MASK
+                child = nodes.get(key)
+                if child is None:
+                    child = nodes[key] = PackedNode(self, edge >> EDGE_TARGET_SHIFT, edge & EDGE_TERMINAL != 0)
+                children[_LETTERS[edge & EDGE_LETTER_MASK]] = child
+                if edge & EDGE_END_OF_LIST:
+                    break
+                edge_index += 1
+        node.children = children
+        self.decoded_nodes.append(node)
+        return children
+
+
+# load a compiled artifact and return its root
+def load_dawg(path, expected_digest=None):
+    return PackedDawg(path, expected_digest).root
+
+
+# return a ready-to-search root for the word list at lexicon_path, compiling the artifact
+# next to it the first time and whenever it is missing, stale or corrupt
+def load_or_build_dawg(lexicon_path, artifact_path=None):
+    if artifact_path is None:
+        artifact_path = lexicon_path + ".dawg"
+    digest = lexicon_digest(lexicon_path)
+    try:
+        return load_dawg(artifact_path, digest)
+    except (OSError, DawgArtifactError):
+        pass
+    root = build_dawg(read_lexicon(lexicon_path))
+    compile_dawg(root, artifact_path, digest)
+    return load_dawg(artifact_path, digest)
+
+
+# compile the artifact of the word list at lexicon_path unless it is up to date, and return its path. Call it
+# before starting workers that map the artifact with init_worker.
+def ensure_artifact(lexicon_path, artifact_path=None):
+    if artifact_path is None:
+        artifact_path = lexicon_path + ".dawg"
+    load_or_build_dawg(lexicon_path, artifact_path)
+    return artifact_path
+
+
+# the DAWG root of this process when it is a pool worker, mapped once when the worker starts
+_worker_root = None
+
+
+# multiprocessing.Pool initializer: map the compiled artifact at artifact_path, see worker_root
+def init_worker(artifact_path):
+    global _worker_root
+    _worker_root = load_dawg(artifact_path)
+
+
+def worker_root():
+    return _worker_root
+
+
 if __name__ == "__main__":
     big_list = open("lexicon/scrabble_words_complete.txt", "r").readlines()
     big_list = [word.strip("\n") for word in big_list]
@@ -0,0 +1,252 @@
+import itertools
+import pickle
+import time
+
+
+# bounds stored with transposition table values
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+# stands in for the depth of table entries whose subtree was searched to the end of the game
+FULL_DEPTH = 1 << 30
+
+
+# moves found first in every position, by the pruned top-k search. The rest are only generated when the search
+# gets past these without a cutoff.
+NUM_ORDERED_MOVES = 8
+
+
+class _Timeout(Exception):
+    pass
+
+
+# the outcome of an endgame search: the move to play (None to pass), its value, the depth of the deepest
+# completed iteration, whether that iteration searched every line to the end of the game, and the nodes and
+# seconds the search took
+class EndgameResult:
+    def __init__(self, move, value, depth, exact, num_nodes, seconds):
+        self.move = move
+        self.value = value
+        self.depth = depth
+        self.exact = exact
+        self.num_nodes = num_nodes
+        self.seconds = seconds
+
+
+# alpha-beta search of positions with an empty bag, where every rack is known. racks holds one rack per
+# player, the player to move first. With two players the value of a position is the points the player to
+# move will score from it minus the opponent's, and the game ends as in Scrabble: when a player goes out,
+# adding the tiles left on the other rack to their score and taking them off the other player's, or when both
+# players pass in a row, each losing the tiles left on their own rack. With one player, as in GameSession, the
+# value is the points still to be scored and the game ends when the player goes out or cannot move.
+#
+# Each solve searches a copy of board with make_move/unmake_move, so board itself is only read and can be
+# drawn meanwhile. Moves are tried best first, after the best move the table holds for the position. The
+# table is keyed by the Zobrist hash, the racks in turn order and the number of passes in a row, and is probed
+# for a move's position before the move is made. It is kept across solves, so the later turns of an endgame
+# start from what the earlier ones found. Iterative deepening keeps the move of the last completed iteration
+# when the time limit is reached.
+class EndgameSolver:
+    def __init__(self, board, max_table_size=1 << 20, max_moves=None, num_ordered_moves=NUM_ORDERED_MOVES):
+        self.board = board
+        self.max_table_size = max_table_size
+        # only try this many of the highest scoring moves in each position when given, which no longer finds
+        # the exact value
+        self.max_moves = max_moves
+        self.num_ordered_moves = num_ordered_moves if max_moves is None else min(num_ordered_moves, max_moves)
+        self.table = {}
+        self._move_lists = {}
+        self.num_nodes = 0
+
+    # cancel, anything with is_set such as a threading.Event, stops the search like the time limit once it is set
+    def solve(self, racks, time_limit=0.5, max_depth=None, cancel=None):
+        start = time.perf_counter()
+        self._deadline = start + time_limit
+        self._cancel = cancel
+        self._racks = [list(rack) for rack in racks]
+        self._num_players = len(self._racks)
+        self.num_nodes = 0
+        self._board = pickle.loads(pickle.dumps(self.board))
+        self._board.dawg_root = self.board.dawg_root
+        # moves are ranked by score alone
+        self._board.leave_values = None
+
+        # the highest scoring move until an iteration completes
+        result = EndgameResult(next(self._ordered_moves(self._racks[0]), None), 0, 0, False, 0, 0.0)
+        key = self._key(0, 0, self._board.zobrist_hash)
+        depth = 1
+        while max_depth is None or depth <= max_depth:
+            self._num_cutoffs = 0
+            try:
+                value = self._search(0, 0, depth, -FULL_DEPTH, FULL_DEPTH, key)
+            except _Timeout:
+                break
+            exact = self._num_cutoffs == 0
+            entry = self.table.get(key)
+            result = EndgameResult(entry[3] if entry else None, value, depth, exact, self.num_nodes, 0.0)
+            if exact:
+                break
+            depth += 1
+
+        self._board = None
+        result.num_nodes = self.num_nodes
+        result.seconds = time.perf_counter() - start
+        return result
+
+    # table key of the position with the given board hash, where player is to move after passes passes in a row
+    def _key(self, player, passes, board_hash):
+        racks = self._racks[player:] + self._racks[:player]
+        return (board_hash, tuple("".join(sorted(rack)) for rack in racks), passes)
+
+    def _rack_value(self, rack):
+        return sum(self._board.point_dict[tile] for tile in rack)
+
+    # the moves of rack on the board, best first, shared by every visit of the position. With two players these
+    # are the num_ordered_moves best from the pruned top-k search, then the rest, which are only generated once
+    # the search gets to them. Alone there are no cutoffs and every move is searched, so they are all generated
+    # at once.
+    def _ordered_moves(self, rack):
+        key = (self._board.zobrist_hash, "".join(sorted(rack)))
+        entry = self._move_lists.get(key)
+        if entry is None:
+            if len(self._move_lists) >= self.max_table_size:
+                self._move_lists.clear()
+            k = self.num_ordered_moves if self._num_players == 2 else self.max_moves
+            if k is None:
+                moves = sorted(self._board.generate_moves(rack), reverse=True)
+                complete = True
+            else:
+                moves = self._board.generate_moves(rack, k, prune=True)
+                complete = len(moves) < k or k == self.max_moves
+            # the moves found so far and whether they are all of them
+            entry = self._move_lists[key] = [moves, complete]
+        moves, complete = entry
+        yield from moves
+        if complete:
+            return
+
+        found = {(move.row, move.col, move.vertical, move.word, tuple(move.blanks)) for move in moves}
+        rest = [move for move in sorted(self._board.generate_moves(rack), reverse=True)
+                if (move.row, move.col, move.vertical, move.word, tuple(move.blanks)) not in found]
+        if self.max_moves is not None:
+            rest = rest[:self.max_moves - len(moves)]
+        entry[:] = [moves + rest, True]
+        yield from rest
+
+    # the table's value for a position searched depth more turns with alpha-beta bounds, None if it has none
+    def _table_value(self, entry, depth, alpha, beta):
+        if entry is None:
+            return None
+        entry_depth, entry_value, entry_bound, _ = entry
+        if entry_depth < depth:
+            return None
+        if entry_bound == EXACT or entry_bound == LOWER and entry_value >= beta or \
+                entry_bound == UPPER and entry_value <= alpha:
+            # a value that stopped short of the end of the game keeps this one from being exact
+            if entry_depth < FULL_DEPTH:
+                self._num_cutoffs += 1
+            return entry_value
+        return None
+
+    # value of the position for player, who is to move after passes passes in a row, searching depth more
+    # turns, as a negamax with alpha-beta bounds. key is the position's table key
+    def _search(self, player, passes, depth, alpha, beta, key):
+        self.num_nodes += 1
+        if time.perf_counter() > self._deadline or self._cancel is not None and self._cancel.is_set():
+            raise _Timeout()
+
+        rack = self._racks[player]
+        opponent = 1 - player if self._num_players == 2 else player
+
+        # every player passed in a row: the game is over
+        if passes == self._num_players:
+            if self._num_players == 1:
+                return 0
+            return self._rack_value(self._racks[opponent]) - self._rack_value(rack)
+        if depth == 0:
+            self._num_cutoffs += 1
+            return self._evaluate(player)
+
+        entry = self.table.get(key)
+        value = self._table_value(entry, depth, alpha, beta)
+        if value is not None:
+            return value
+
+        moves = self._ordered_moves(rack)
+        best_move = entry[3] if entry is not None else None
+        if best_move is not None:
+            moves = itertools.chain([best_move], (move for move in moves if move is not best_move))
+
+        original_alpha = alpha
+        num_cutoffs = self._num_cutoffs
+        best_value = None
+        for move in itertools.chain(moves, [None]):
+            # alone, passing only ends the game, so it is only tried when there is no move
+            if move is None and best_value is not None and self._num_players == 1:
+                break
+            value = self._child_value(player, opponent, passes, depth, alpha, beta, move)
+            if best_value is None or value > best_value:
+                best_value = value
+                best_move = move
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+
+        if best_value <= original_alpha:
+            bound = UPPER
+        elif best_value >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        searched_depth = FULL_DEPTH if self._num_cutoffs == num_cutoffs else depth
+        if len(self.table) >= self.max_table_size:
+            self.table.clear()
+        self.table[key] = (searched_depth, best_value, bound, best_move)
+        return best_value
+
+    # value for player of playing move, None for a pass, and searching on from there
+    def _child_value(self, player, opponent, passes, depth, alpha, beta, move):
+        board = self._board
+        if move is None:
+            if self._num_players == 1:
+                return self._search(player, passes + 1, depth - 1, alpha, beta,
+                                    self._key(player, passes + 1, board.zobrist_hash))
+            return -self._search(opponent, passes + 1, depth - 1, -beta, -alpha,
+                                 self._key(opponent, passes + 1, board.zobrist_hash))
+
+        rack = self._racks[player]
+        for tile in move.tiles:
+            rack.remove(tile)
+        try:
+            score = move.score
+            if not rack:
+                # going out ends the game
+                if self._num_players == 1:
+                    return score
+                return score + 2 * self._rack_value(self._racks[opponent])
+            if self._num_players == 1:
+                next_player, child_alpha, child_beta = player, alpha - score, beta - score
+            else:
+                next_player, child_alpha, child_beta = opponent, score - beta, score - alpha
+
+            # the position after the move may be in the table already, reached by playing the same tiles in
+            # another order
+            key = self._key(next_player, 0, board.hash_after(move))
+            value = self._table_value(self.table.get(key), depth - 1, child_alpha, child_beta)
+            if value is None:
+                delta = board.make_move(move)
+                try:
+                    value = self._search(next_player, 0, depth - 1, child_alpha, child_beta, key)
+                finally:
+                    board.unmake_move(delta)
+            return score + value if self._num_players == 1 else score - value
+        finally:
+            rack.extend(move.tiles)
+
+    # estimate of a position where the search stops early: every player is stuck with their tiles
+    def _evaluate(self, player):
+        if self._num_players == 1:
+            return 0
+        opponent = 1 - player
+        return self._rack_value(self._racks[opponent]) - self._rack_value(self._racks[player])
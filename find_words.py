@@ -1,4 +1,5 @@
 from dawg import *
+from rack import RACK_INDEX, rack_counts
 import pickle
 
 
@@ -24,50 +25,57 @@ def score_word(word):
     return word, score
 
 
-def extend_right(start_node, square, rack, word):
+# words found are added to word_score_dict with their scores
+def extend_right(start_node, square, rack, word, word_score_dict):
     # execute if square is empty
     if not square.letter:
         if start_node.is_terminal:
             word, score = score_word(word)
             word_score_dict[word] = score
-        for letter in rack:
-            if letter in start_node.children:
-                new_node = start_node.children[letter]
-                new_rack = rack.copy()
-                new_rack.remove(letter)
-                new_word = word + letter
-                extend_right(new_node, square.right_neighbor, new_rack, new_word)
+        for letter, new_node in start_node.children.items():
+            index = RACK_INDEX[letter]
+            if rack[index]:
+                rack[index] -= 1
+                extend_right(new_node, square.right_neighbor, rack, word + letter, word_score_dict)
+                rack[index] += 1
     else:
         if square.letter in start_node.children:
             new_node = start_node.children[square.letter]
             new_word = word + square.letter
-            extend_right(new_node, square.right_neighbor, rack, new_word)
+            extend_right(new_node, square.right_neighbor, rack, new_word, word_score_dict)
 
 
-def left_part(start_node, anchor_square, rack, word, limit):
-    extend_right(start_node, anchor_square, rack, word)
+def left_part(start_node, anchor_square, rack, word, limit, word_score_dict):
+    extend_right(start_node, anchor_square, rack, word, word_score_dict)
     if limit > 0:
-        for letter in rack:
-            if letter in start_node.children:
-                new_node = start_node.children[letter]
-                new_rack = rack.copy()
-                new_rack.remove(letter)
-                new_word = word + letter
-                left_part(new_node, anchor_square, new_rack, new_word, limit - 1)
+        for letter, new_node in start_node.children.items():
+            index = RACK_INDEX[letter]
+            if rack[index]:
+                rack[index] -= 1
+                left_part(new_node, anchor_square, rack, word + letter, limit - 1, word_score_dict)
+                rack[index] += 1
 
 
 # As a start, this function should take an already-filled square with no neighbors and compute
-# all possible words using the square and the tiles from the rack
+# all possible words using the square and the tiles from the rack, given as tile counts (see rack.py).
+# Returns a dict of the words found and their scores
 def get_all_words(start_node, square, rack, word):
+    word_score_dict = {}
+
     # get all words that start with the filled letter
-    extend_right(start_node, square, rack, word)
+    extend_right(start_node, square, rack, word, word_score_dict)
 
-    # try every letter in rack as possible anchor square
-    for i, letter in enumerate(rack):
+    # try every distinct letter in rack as possible anchor square
+    for letter, index in RACK_INDEX.items():
+        if letter == "%" or not rack[index]:
+            continue
         anchor_square = Square(letter)
         anchor_square.right_neighbor = square
-        temp_rack = rack[:i] + rack[i+1:]
-        left_part(start_node, anchor_square, temp_rack, "", 5)
+        rack[index] -= 1
+        left_part(start_node, anchor_square, rack, "", 5, word_score_dict)
+        rack[index] += 1
+
+    return word_score_dict
 
 
 if __name__ == "__main__":
@@ -75,8 +83,7 @@ if __name__ == "__main__":
     root = pickle.load(to_load)
     to_load.close()
 
-    word_score_dict = {}
-    word_rack = ["E", "S", "T", "O"]
+    word_rack = rack_counts(["E", "S", "T", "O"])
 
     placed_square = Square("H")
     a = Square()
@@ -97,7 +104,7 @@ if __name__ == "__main__":
     f.right_neighbor = g
     g.right_neighbor = h
 
-    get_all_words(root, placed_square, word_rack, "")
+    word_score_dict = get_all_words(root, placed_square, word_rack, "")
 
     out = list(sorted(word_score_dict.items(), key=lambda x: x[1], reverse=True))
     [print(elem) for elem in out]
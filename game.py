@@ -1,11 +1,16 @@
-import copy
-
 from dawg import *
 from board import ScrabbleBoard, BoardParams
+from session import GameSession, SessionObserver, BackgroundPlayer, refill_word_rack, parse_tests_file, \
+    parse_board_and_letters, parse_test_cases
 import pygame
 import sys
 
 
+# frames per second of the game window, and how long each move stays on screen before the next search
+FRAME_RATE = 30
+TURN_DELAY = 75
+
+
 # returns a list of all words played on the board
 def all_board_words(board, board_params):
     board_words = []
@@ -37,155 +42,179 @@ def all_board_words(board, board_params):
     return board_words
 
 
-def refill_word_rack(rack, tile_bag):
-    to_add = min([7 - len(rack), len(tile_bag)])
-    new_letters = tile_bag[:to_add]
-    rack = rack + new_letters
-    return rack, new_letters
-
-
-def draw_board(board, board_params):
-    for y in range(board_params.num_rows):
-        for x in range(board_params.num_cols):
-            if board[x][y].letter:
-                if board[x][y].letter == "I":
-                    letter_x_offset = 15
-                else:
-                    letter_x_offset = 7
-                pygame.draw.rect(screen, (255, 215, 0), [(margin + square_width) * x + margin + x_offset,
-                                                         (margin + square_height) * y + margin + y_offset,
-                                                         square_width, square_height])
-
-                letter = tile_font.render(board[x][y].letter, True, (0, 0, 0))
-                screen.blit(letter, ((margin + square_width) * x + margin + x_offset + letter_x_offset,
-                                     (margin + square_height) * y + margin + y_offset + 7))
-
-                letter_score = modifier_font.render(str(game.point_dict[board[x][y].letter]), True, (0, 0, 0))
-                screen.blit(letter_score, ((margin + square_width) * x + margin + x_offset + 31,
-                                           (margin + square_height) * y + margin + y_offset + 30))
-
-            elif "3LS" in board[x][y].modifier:
-                pygame.draw.rect(screen, (0, 100, 200), [(margin + square_width) * x + margin + x_offset,
-                                                         (margin + square_height) * y + margin + y_offset,
-                                                         square_width, square_height])
-                text_top = modifier_font.render("TRIPLE", True, (0, 0, 0))
-                text_mid = modifier_font.render("LETTER", True, (0, 0, 0))
-                text_bot = modifier_font.render("SCORE", True, (0, 0, 0))
-                screen.blit(text_top, ((margin + square_width) * x + margin + x_offset + 5,
-                                       (margin + square_height) * y + margin + y_offset + 7))
-                screen.blit(text_mid, ((margin + square_width) * x + margin + x_offset + 5,
-                                       (margin + square_height) * y + margin + y_offset + 17))
-                screen.blit(text_bot, ((margin + square_width) * x + margin + x_offset + 5,
-                                       (margin + square_height) * y + margin + y_offset + 27))
-
-            elif "2LS" in board[x][y].modifier:
-                pygame.draw.rect(screen, (173, 216, 230), [(margin + square_width) * x + margin + x_offset,
-                                                           (margin + square_height) * y + margin + y_offset,
-                                                           square_width, square_height])
-                text_top = modifier_font.render("DOUBLE", True, (0, 0, 0))
-                text_mid = modifier_font.render("LETTER", True, (0, 0, 0))
-                text_bot = modifier_font.render("SCORE", True, (0, 0, 0))
-                screen.blit(text_top, ((margin + square_width) * x + margin + x_offset + 3,
-                                       (margin + square_height) * y + margin + y_offset + 7))
-                screen.blit(text_mid, ((margin + square_width) * x + margin + x_offset + 5,
-                                       (margin + square_height) * y + margin + y_offset + 17))
-                screen.blit(text_bot, ((margin + square_width) * x + margin + x_offset + 5,
-                                       (margin + square_height) * y + margin + y_offset + 27))
-
-            elif "2WS" in board[x][y].modifier:
-                pygame.draw.rect(screen, (255, 204, 203), [(margin + square_width) * x + margin + x_offset,
-                                                           (margin + square_height) * y + margin + y_offset,
-                                                           square_width, square_height])
-                text_top = modifier_font.render("DOUBLE", True, (0, 0, 0))
-                text_mid = modifier_font.render("WORD", True, (0, 0, 0))
-                text_bot = modifier_font.render("SCORE", True, (0, 0, 0))
-                screen.blit(text_top, ((margin + square_width) * x + margin + x_offset + 3,
-                                       (margin + square_height) * y + margin + y_offset + 7))
-                screen.blit(text_mid, ((margin + square_width) * x + margin + x_offset + 5,
-                                       (margin + square_height) * y + margin + y_offset + 17))
-                screen.blit(text_bot, ((margin + square_width) * x + margin + x_offset + 5,
-                                       (margin + square_height) * y + margin + y_offset + 27))
-
-            elif "3WS" in board[x][y].modifier:
-                pygame.draw.rect(screen, (237, 28, 36), [(margin + square_width) * x + margin + x_offset,
-                                                         (margin + square_height) * y + margin + y_offset,
-                                                         square_width, square_height])
-                text_top = modifier_font.render("TRIPLE", True, (0, 0, 0))
-                text_mid = modifier_font.render("WORD", True, (0, 0, 0))
-                text_bot = modifier_font.render("SCORE", True, (0, 0, 0))
-                screen.blit(text_top, ((margin + square_width) * x + margin + x_offset + 5,
-                                       (margin + square_height) * y + margin + y_offset + 7))
-                screen.blit(text_mid, ((margin + square_width) * x + margin + x_offset + 5,
-                                       (margin + square_height) * y + margin + y_offset + 17))
-                screen.blit(text_bot, ((margin + square_width) * x + margin + x_offset + 5,
-                                       (margin + square_height) * y + margin + y_offset + 27))
-
-            else:
-                pygame.draw.rect(screen, (210, 180, 140), [(margin + square_width) * x + margin + x_offset,
-                                                           (margin + square_height) * y + margin + y_offset,
-                                                           square_width, square_height])
-
-
-def draw_start_screen():
-    screen.fill((255, 255, 255))
-    intro_text = tile_font.render(f"Scrabble Solver Demonstration", True, (0, 0, 0))
-    intro_rect = intro_text.get_rect(center=(screen_width // 2, screen_height // 4))
-    screen.blit(intro_text, intro_rect)
-
-    info_text = tile_font.render(f"Press Space to Generate New Game Once Game is Finished", True, (0, 0, 0))
-    info_rect = info_text.get_rect(center=(screen_width // 2, screen_height // 4 + 100))
-    screen.blit(info_text, info_rect)
-
-    space_text = tile_font.render("Press Space to Start", True, (0, 0, 0))
-    space_rect = space_text.get_rect(center=(screen_width // 2, screen_height // 2))
-    screen.blit(space_text, space_rect)
-
-
-def draw_rack(rack):
-    for i, letter in enumerate(rack):
-        if letter == "I":
-            letter_x_offset = 15
+# draws a GameSession with pygame after every turn. Pass it to the session as an observer; the session itself
+# runs without it. Squares and text are rendered once and cached, and after the first frame of a session only
+# the squares, rack, score list and status line that changed are drawn and updated on the display.
+class PygameRenderer(SessionObserver):
+    # colour and label lines of the premium squares, with the x offset of each line
+    MODIFIER_STYLES = {"3LS": ((0, 100, 200), (("TRIPLE", 5), ("LETTER", 5), ("SCORE", 5))),
+                       "2LS": ((173, 216, 230), (("DOUBLE", 3), ("LETTER", 5), ("SCORE", 5))),
+                       "2WS": ((255, 204, 203), (("DOUBLE", 3), ("WORD", 5), ("SCORE", 5))),
+                       "3WS": ((237, 28, 36), (("TRIPLE", 5), ("WORD", 5), ("SCORE", 5)))}
+
+    def __init__(self, screen_width=1000, screen_height=800):
+        self.screen_width = screen_width
+        self.screen_height = screen_height
+        self.screen = pygame.display.set_mode((screen_width, screen_height))
+        self.square_width = 40
+        self.square_height = 40
+        self.margin = 3
+        self.x_offset = 20
+        self.y_offset = 20
+        self.modifier_font = pygame.font.Font(None, 12)
+        self.tile_font = pygame.font.Font(None, 45)
+        self.score_font = pygame.font.Font(None, 25)
+
+        # screen areas of the rack, the status line and the score list, cleared before they are redrawn
+        self.rack_rect = pygame.Rect(0, 700, 700, self.square_height)
+        self.status_rect = pygame.Rect(0, 760, 700, screen_height - 760)
+        self.score_rect = pygame.Rect(700, 0, screen_width - 700, screen_height)
+
+        self._square_surfaces = {}
+        self._text_surfaces = {}
+        self._session = None
+
+    def on_turn(self, session, turn):
+        self.draw(session)
+
+    # draw a frame of the session, with a status line while its next move is being searched. The first frame
+    # of a session is drawn whole, later ones only where something changed since the last frame.
+    def draw(self, session, thinking=False):
+        dirty_rects = []
+        if session is not self._session:
+            self._session = session
+            self._drawn_squares = {}
+            self._drawn_rack = self._drawn_scores = self._drawn_thinking = None
+            self.screen.fill((0, 0, 0))
+            dirty_rects.append(self.screen.get_rect())
+
+        dirty_rects += self.draw_board(session.game.board, session.board_params, session.game.point_dict)
+        dirty_rects += self.draw_rack(session.word_rack, session.game.point_dict)
+        dirty_rects += self.draw_computer_score(session.game.word_score_dict)
+        dirty_rects += self.draw_status(thinking)
+        if dirty_rects:
+            pygame.display.update(dirty_rects)
+
+    # text rendered in black unless given a colour, cached by font, text and colour
+    def _text(self, font, text, colour=(0, 0, 0)):
+        key = (font, text, colour)
+        surface = self._text_surfaces.get(key)
+        if surface is None:
+            surface = self._text_surfaces[key] = font.render(text, True, colour)
+        return surface
+
+    # the look of a board square: its letter if it holds a tile, otherwise its premium, None for plain squares
+    def _square_key(self, square):
+        if square.letter:
+            return "tile", square.letter
+        if square.modifier in self.MODIFIER_STYLES:
+            return "premium", square.modifier
+        return None
+
+    # a whole square with the look of key, rendered the first time it is needed
+    def _square_surface(self, key, point_dict):
+        surface = self._square_surfaces.get(key)
+        if surface is not None:
+            return surface
+
+        surface = pygame.Surface((self.square_width, self.square_height))
+        if key is None:
+            surface.fill((210, 180, 140))
+        elif key[0] == "tile":
+            letter = key[1]
+            letter_x_offset = 15 if letter == "I" else 7
+            surface.fill((255, 215, 0))
+            surface.blit(self._text(self.tile_font, letter), (letter_x_offset, 7))
+            surface.blit(self._text(self.modifier_font, str(point_dict[letter])), (31, 30))
         else:
-            letter_x_offset = 7
-        pygame.draw.rect(screen, (255, 215, 0), [(margin + square_width) * (i + 4) + margin + x_offset,
-                                                 700,
-                                                 square_width, square_height])
-
-        if letter == "%":
-            tile_letter = tile_font.render(" ", True, (0, 0, 0))
-        else:
-            tile_letter = tile_font.render(letter, True, (0, 0, 0))
-        screen.blit(tile_letter, ((margin + square_width) * (i + 4) + margin + x_offset + letter_x_offset,
-                                  700 + 7))
-
-        letter_score = modifier_font.render(str(game.point_dict[letter]), True, (0, 0, 0))
-        screen.blit(letter_score, ((margin + square_width) * (i + 4) + margin + x_offset + 31,
-                                   700 + 30))
-
-
-def draw_computer_score(word_score_dict):
-    x_start = 700
-    y_start = 50
-    total = 0
-    pygame.draw.rect(screen, (210, 180, 140), [x_start, 25, 255, 50])
-    score_title = score_font.render("Computer Score", True, (0, 0, 0))
-    screen.blit(score_title, (x_start + 50, 25))
-    pygame.draw.rect(screen, (210, 180, 140), [x_start, y_start, 255, 700])
-    i = 0
-    for word, score in word_score_dict.items():
-        if y_start * (i+1) > 665:
-            x_start += 130
-            i = 0
-        total += score
-        word = score_font.render(word, True, (0, 0, 0))
-        score = score_font.render(str(score), True, (0, 0, 0))
-        screen.blit(word, (x_start + 2, y_start * (i+1)))
-        screen.blit(score, (x_start + 105, y_start * (i+1)))
-
-        i += .35
-
-    total_score = score_font.render(f"Total Score: {total}", True, (0, 0, 0))
-    screen.blit(total_score, (705, 700))
+            colour, labels = self.MODIFIER_STYLES[key[1]]
+            surface.fill(colour)
+            for i, (label, label_x_offset) in enumerate(labels):
+                surface.blit(self._text(self.modifier_font, label), (label_x_offset, 7 + 10 * i))
+        self._square_surfaces[key] = surface
+        return surface
+
+    # draw the squares that changed since the last frame and return their rects
+    def draw_board(self, board, board_params, point_dict):
+        dirty_rects = []
+        for y in range(board_params.num_rows):
+            for x in range(board_params.num_cols):
+                key = self._square_key(board[x][y])
+                if (x, y) in self._drawn_squares and self._drawn_squares[x, y] == key:
+                    continue
+                self._drawn_squares[x, y] = key
+                left = (self.margin + self.square_width) * x + self.margin + self.x_offset
+                top = (self.margin + self.square_height) * y + self.margin + self.y_offset
+                dirty_rects.append(self.screen.blit(self._square_surface(key, point_dict), (left, top)))
+        return dirty_rects
+
+    def draw_start_screen(self):
+        self.screen.fill((255, 255, 255))
+        intro_text = self.tile_font.render(f"Scrabble Solver Demonstration", True, (0, 0, 0))
+        intro_rect = intro_text.get_rect(center=(self.screen_width // 2, self.screen_height // 4))
+        self.screen.blit(intro_text, intro_rect)
+
+        info_text = self.tile_font.render(f"Press Space to Generate New Game Once Game is Finished", True, (0, 0, 0))
+        info_rect = info_text.get_rect(center=(self.screen_width // 2, self.screen_height // 4 + 100))
+        self.screen.blit(info_text, info_rect)
+
+        space_text = self.tile_font.render("Press Space to Start", True, (0, 0, 0))
+        space_rect = space_text.get_rect(center=(self.screen_width // 2, self.screen_height // 2))
+        self.screen.blit(space_text, space_rect)
+        self._session = None
+
+    # redraw the rack if it changed since the last frame and return the rects drawn
+    def draw_rack(self, rack, point_dict):
+        if rack == self._drawn_rack:
+            return []
+        self._drawn_rack = list(rack)
+        self.screen.fill((0, 0, 0), self.rack_rect)
+        for i, letter in enumerate(rack):
+            letter_x_offset = 15 if letter == "I" else 7
+            left = (self.margin + self.square_width) * (i + 4) + self.margin + self.x_offset
+            pygame.draw.rect(self.screen, (255, 215, 0), [left, 700, self.square_width, self.square_height])
+            self.screen.blit(self._text(self.tile_font, " " if letter == "%" else letter),
+                             (left + letter_x_offset, 700 + 7))
+            self.screen.blit(self._text(self.modifier_font, str(point_dict[letter])), (left + 31, 700 + 30))
+        return [self.rack_rect]
+
+    # redraw the score list if it changed since the last frame and return the rects drawn
+    def draw_computer_score(self, word_score_dict):
+        scores = list(word_score_dict.items())
+        if scores == self._drawn_scores:
+            return []
+        self._drawn_scores = scores
+        self.screen.fill((0, 0, 0), self.score_rect)
+
+        x_start = 700
+        y_start = 50
+        total = 0
+        pygame.draw.rect(self.screen, (210, 180, 140), [x_start, 25, 255, 50])
+        self.screen.blit(self._text(self.score_font, "Computer Score"), (x_start + 50, 25))
+        pygame.draw.rect(self.screen, (210, 180, 140), [x_start, y_start, 255, 700])
+        i = 0
+        for word, score in scores:
+            if y_start * (i+1) > 665:
+                x_start += 130
+                i = 0
+            total += score
+            self.screen.blit(self._text(self.score_font, word), (x_start + 2, y_start * (i+1)))
+            self.screen.blit(self._text(self.score_font, str(score)), (x_start + 105, y_start * (i+1)))
+
+            i += .35
+
+        self.screen.blit(self.score_font.render(f"Total Score: {total}", True, (0, 0, 0)), (705, 700))
+        return [self.score_rect]
+
+    # redraw the status line if it changed since the last frame and return the rects drawn
+    def draw_status(self, thinking):
+        if thinking == self._drawn_thinking:
+            return []
+        self._drawn_thinking = thinking
+        self.screen.fill((0, 0, 0), self.status_rect)
+        if thinking:
+            self.screen.blit(self._text(self.score_font, "Thinking...", (255, 255, 255)), (self.x_offset, 760))
+        return [self.status_rect]
 
 
 def load_dictionary(file_path):
@@ -197,32 +226,6 @@ def word_exists_in_dictionary(word, dictionary):
     return word.lower() in dictionary
 
 
-def parse_tests_file(file_path):
-    with open(file_path, 'r') as file:
-        file_content = file.read()
-        return file_content
-
-
-def parse_board_and_letters(test_case):
-    lines = test_case.strip().split('\n')
-    ordered_letters = lines[0]
-    board_definition = "\n".join(lines[1:])
-    return ordered_letters, board_definition
-
-
-def parse_test_cases(content):
-    test_cases = content.strip().split('\n\n')
-    parsed_test_cases = []
-
-    for test_case in test_cases:
-        lines = test_case.strip().split('\n', 1)
-        test_number = int(lines[0].strip().strip(':'))
-        ordered_letters, board_definition = parse_board_and_letters(lines[1])
-        parsed_test_cases.append((test_number, ordered_letters, board_definition))
-
-    return parsed_test_cases
-
-
 if __name__ == "__main__":
 
     letter_points = {'A': 1, 'B': 3, 'C': 3, 'D': 2, 'E': 1, 'F': 4, 'G': 2,
@@ -231,8 +234,8 @@ if __name__ == "__main__":
                      'U': 1, 'V': 4, 'W': 4, 'X': 8, 'Y': 4, 'Z': 10};
 
     dictionary_file = "dictionary.txt"  # Assuming "dictionary.txt" contains the valid words
-    dictionary = load_dictionary(dictionary_file)
-    root = build_dawg(dictionary)
+    # compiled once into dictionary.txt.dawg and memory-mapped on later launches
+    root = load_or_build_dawg(dictionary_file)
     #print(root)
 
     file_path = "C2.txt"
@@ -246,75 +249,35 @@ if __name__ == "__main__":
 
         print(f"{test_number}:")
 
-        ordered_letters_list = list(map(str.upper, list(ordered_letters)))
         board_params = BoardParams(board_definition)
 
         pygame.init()
-
-        # Game-level variables
-        screen_width = 1000
-        screen_height = 800
-        screen = pygame.display.set_mode((screen_width, screen_height))
+        renderer = PygameRenderer()
+        pygame.display.set_caption("Scrabble")
         clock = pygame.time.Clock()
-        square_width = 40
-        square_height = 40
-        margin = 3
-        mouse_x = 0
-        mouse_y = 0
-        x_offset = 20
-        y_offset = 20
-        modifier_font = pygame.font.Font(None, 12)
-        tile_font = pygame.font.Font(None, 45)
-        score_font = pygame.font.Font(None, 25)
-
-        tile_bag = copy.deepcopy(ordered_letters_list)
-        #print(f"{tile_bag}")
-        word_rack = tile_bag[:7]
-        [tile_bag.remove(letter) for letter in word_rack]
-        game = ScrabbleBoard(root, board_params)
-        word_rack = game.get_start_move(word_rack)
-        word_rack, new_letters = refill_word_rack(word_rack, tile_bag)
-        [tile_bag.remove(letter) for letter in new_letters]
 
-        pygame.display.set_caption("Scrabble")
+        # the searches run on a background thread, the loop keeps drawing frames and handling keys meanwhile
+        session = GameSession(root, board_params, ordered_letters)
+        player = BackgroundPlayer(session)
+        next_turn = 0
 
-        while True:
-            pygame.display.update()
+        while not session.over:
             for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    player.shutdown()
+                    pygame.quit()
+                    sys.exit()
                 if event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_SPACE:
-                        tile_bag = copy.deepcopy(ordered_letters_list)
-                        print(f"{tile_bag}")
-
-                        word_rack = tile_bag[:7]
-                        [tile_bag.remove(letter) for letter in word_rack]
-                        game = ScrabbleBoard(root, board_params)
-                        game.get_start_move(word_rack)
-                        word_rack, new_letters = refill_word_rack(word_rack, tile_bag)
-                        [tile_bag.remove(letter) for letter in new_letters]
-
-            screen.fill((0, 0, 0))
-
-            word_rack = game.get_best_move(word_rack)
-            word_rack, new_letters = refill_word_rack(word_rack, tile_bag)
-            [tile_bag.remove(letter) for letter in new_letters]
-            if game.best_word == "":
-                # draw new hand if can't find any words
-                if len(tile_bag) >= 7:
-                    return_to_bag_words = word_rack.copy()
-                    word_rack, new_letters = refill_word_rack([], tile_bag)
-                    [tile_bag.remove(letter) for letter in new_letters]
-
-                else:
-                    #for word in all_board_words(game.board, board_params):
-                    #    if not find_in_dawg(word, root) and word:
-                    #        raise Exception(f"Invalid word on board: {word}")
-                    draw_board(game.board, board_params)
-                    draw_rack(word_rack)
-                    draw_computer_score(game.word_score_dict)
-                    break
-
-            draw_board(game.board, board_params)
-            draw_rack(word_rack)
-            draw_computer_score(game.word_score_dict)
-            pygame.time.wait(75)
+                        print(f"{list(ordered_letters.upper())}")
+                        session = GameSession(root, board_params, ordered_letters)
+                        player.start(session)
+
+            # leave each move on screen for TURN_DELAY ms before searching for the next one
+            if pygame.time.get_ticks() >= next_turn and player.poll() is not None:
+                next_turn = pygame.time.get_ticks() + TURN_DELAY
+
+            renderer.draw(session, player.thinking)
+            clock.tick(FRAME_RATE)
+
+        player.shutdown()
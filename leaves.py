@@ -0,0 +1,199 @@
+import argparse
+import array
+import itertools
+import json
+import os
+import struct
+
+from artifact import ArtifactError, MappedArtifact, write_artifact
+from rack import RACK_INDEX
+
+
+# On-disk leave-value table: the value, in hundredths of a point, of keeping each multiset of up to
+# MAX_LEAVE_TILES tiles on the rack after a play. Tiles are A-Z and blanks ("%").
+#
+# Layout (little-endian):
+#   header  magic, format version, largest leave size, entry count, largest value, crc32 of the values
+#   values  int16 * num_entries, indexed by leave_index
+LEAVES_MAGIC = b"LEAV"
+LEAVES_FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sHHIhI")
+
+MAX_LEAVE_TILES = 6
+NUM_TILE_TYPES = 27
+VALUE_SCALE = 100
+
+# binomial coefficients up to the largest needed by leave_index
+_BINOMIALS = [[0] * (MAX_LEAVE_TILES + 1) for _ in range(NUM_TILE_TYPES + MAX_LEAVE_TILES)]
+for _n in range(NUM_TILE_TYPES + MAX_LEAVE_TILES):
+    _BINOMIALS[_n][0] = 1
+    for _k in range(1, min(_n, MAX_LEAVE_TILES) + 1):
+        _BINOMIALS[_n][_k] = _BINOMIALS[_n - 1][_k - 1] + (_BINOMIALS[_n - 1][_k] if _k < _n else 0)
+
+# index of the first leave of each size: all smaller leaves come first
+_SIZE_OFFSETS = [0]
+for _size in range(MAX_LEAVE_TILES + 1):
+    _SIZE_OFFSETS.append(_SIZE_OFFSETS[-1] + _BINOMIALS[NUM_TILE_TYPES + _size - 1][_size])
+NUM_LEAVES = _SIZE_OFFSETS[-1]
+
+
+class LeaveTableError(ArtifactError):
+    pass
+
+
+# index of a leave in the table, given its tiles as rack indices (see rack.py) in increasing order. Leaves of
+# each size are numbered by the combinatorial number system, which makes the index a perfect hash of the
+# multiset computed in one step per tile.
+def leave_index(tile_indices):
+    index = _SIZE_OFFSETS[len(tile_indices)]
+    for i, tile in enumerate(tile_indices):
+        index += _BINOMIALS[tile + i][i + 1]
+    return index
+
+
+def leave_tiles(letters):
+    return sorted(RACK_INDEX[letter] for letter in letters)
+
+
+# write values, a sequence of NUM_LEAVES values in points indexed by leave_index, atomically to path
+def compile_leaves(values, path):
+    packed = array.array("h", [max(-32768, min(32767, round(value * VALUE_SCALE))) for value in values])
+    if len(packed) != NUM_LEAVES:
+        raise ValueError(f"Expected {NUM_LEAVES} leave values, got {len(packed)}")
+    write_artifact(path, _HEADER, LEAVES_MAGIC, LEAVES_FORMAT_VERSION,
+                   (MAX_LEAVE_TILES, NUM_LEAVES, max(packed)), packed)
+
+
+# a memory-mapped leave-value table
+class LeaveValues:
+    def __init__(self, path):
+        self.path = path
+        self._artifact = MappedArtifact(path, _HEADER, LEAVES_MAGIC, LEAVES_FORMAT_VERSION, "leave table",
+                                        LeaveTableError)
+        max_tiles, num_entries, max_value = self._artifact.fields
+        if max_tiles != MAX_LEAVE_TILES or num_entries != NUM_LEAVES:
+            raise LeaveTableError(f"{path} has the wrong size")
+        self.values = self._artifact.values("h", num_entries)
+        # no leave is worth more, used to keep pruning by score admissible
+        self.max_value = max_value / VALUE_SCALE
+
+    # value in points of keeping the given letters
+    def value(self, letters):
+        if not letters:
+            return 0.0
+        return self.values[leave_index(leave_tiles(letters))] / VALUE_SCALE
+
+    # value of the leave of every play from rack, keyed by the played tiles in sorted order. A rack has at
+    # most 2 ** 7 sub-multisets, so the search looks each play up in this instead of the table.
+    def for_rack(self, rack):
+        tiles = sorted(rack)
+        values = {}
+        for num_played in range(1, len(tiles) + 1):
+            for played in itertools.combinations(tiles, num_played):
+                key = "".join(played)
+                if key in values:
+                    continue
+                leave = list(tiles)
+                for tile in played:
+                    leave.remove(tile)
+                values[key] = self.value(leave) if len(leave) <= MAX_LEAVE_TILES else 0.0
+        return values
+
+    # looked up by path when unpickled, so boards carrying a table can be sent to worker processes, which open
+    # and check it once
+    def __reduce__(self):
+        return load_leaves, (self.path,)
+
+
+# the tables opened in this process by path, with the size and modification time of the file they were read from
+_open_tables = {}
+
+
+# the leave table at path, opened once per process until the file changes
+def load_leaves(path):
+    stat = os.stat(path)
+    version = (stat.st_size, stat.st_mtime_ns)
+    entry = _open_tables.get(path)
+    if entry is None or entry[0] != version:
+        entry = _open_tables[path] = (version, LeaveValues(path))
+    return entry[1]
+
+
+# training samples from batch.py output: (leave, how much more than its game's average the next turn scored)
+# for every turn with a move that is followed by another turn. Boards score very differently, so each game is
+# compared with itself.
+def read_samples(batch_paths):
+    samples = []
+    for batch_path in batch_paths:
+        with open(batch_path, "r") as file:
+            for line in file:
+                result = json.loads(line)
+                turns = result.get("turns", [])
+                if not turns:
+                    continue
+                mean = sum(turn["score"] for turn in turns) / len(turns)
+                for turn, next_turn in zip(turns, turns[1:]):
+                    if turn.get("leave") is not None:
+                        samples.append((turn["leave"], next_turn["score"] - mean))
+    return samples
+
+
+# fit leave values to samples: each tile gets an additive value by ridge regression, and leaves seen often
+# enough move from the sum of their tiles' values towards their own mean, weighted by prior_weight samples of
+# the sum.
+def fit_leave_values(samples, ridge=10.0, prior_weight=10, iterations=50):
+    if not samples:
+        raise ValueError("No samples to fit leave values to")
+    counts = []
+    for leave, _ in samples:
+        tile_counts = [0] * NUM_TILE_TYPES
+        for letter in leave:
+            tile_counts[RACK_INDEX[letter]] += 1
+        counts.append(tile_counts)
+    targets = [target for _, target in samples]
+
+    # coordinate descent on the ridge least squares problem, there are only NUM_TILE_TYPES weights
+    tile_samples = [[i for i, sample_counts in enumerate(counts) if sample_counts[tile]]
+                    for tile in range(NUM_TILE_TYPES)]
+    tile_values = [0.0] * NUM_TILE_TYPES
+    predictions = [0.0] * len(samples)
+    for _ in range(iterations):
+        for tile, indices in enumerate(tile_samples):
+            numerator = denominator = 0.0
+            for i in indices:
+                count = counts[i][tile]
+                numerator += count * (targets[i] - predictions[i] + count * tile_values[tile])
+                denominator += count * count
+            change = numerator / (denominator + ridge) - tile_values[tile]
+            for i in indices:
+                predictions[i] += change * counts[i][tile]
+            tile_values[tile] += change
+
+    residuals = {}
+    for (leave, _), target, prediction in zip(samples, targets, predictions):
+        if len(leave) <= MAX_LEAVE_TILES:
+            total, num_samples = residuals.get(leave, (0.0, 0))
+            residuals[leave] = (total + target - prediction, num_samples + 1)
+
+    values = [0.0] * NUM_LEAVES
+    for size in range(1, MAX_LEAVE_TILES + 1):
+        for leave in itertools.combinations_with_replacement(range(NUM_TILE_TYPES), size):
+            values[leave_index(leave)] = sum(tile_values[tile] for tile in leave)
+    for leave, (total, num_samples) in residuals.items():
+        values[leave_index(leave_tiles(leave))] += total / (num_samples + prior_weight)
+    return values
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a leave-value table from batch.py self-play output.")
+    parser.add_argument("batch_output", nargs="+", help="JSON lines written by batch.py")
+    parser.add_argument("--output", default="leaves.bin")
+    args = parser.parse_args(argv)
+
+    samples = read_samples(args.batch_output)
+    compile_leaves(fit_leave_values(samples), args.output)
+    print(f"{len(samples)} samples, {NUM_LEAVES} leaves written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import multiprocessing
+import pickle
+
+from dawg import ensure_artifact, init_worker, worker_root
+
+
+# search one group of lines of a pickled board in a worker process
+def _generate_moves(board_state, rack, k, prune, lines):
+    board = pickle.loads(board_state)
+    board.dawg_root = worker_root()
+    return board.generate_moves(rack, k, prune, lines=lines)
+
+
+# move generation split by board line across a pool of worker processes. Every worker maps the compiled DAWG
+# artifact read-only, so only the board and the rack are sent for each search. Each worker returns the k best
+# moves of its lines and these are merged by rank, which gives the same moves as ScrabbleBoard.generate_moves.
+class ParallelMoveGenerator:
+    def __init__(self, lexicon_path, num_workers=None, artifact_path=None):
+        artifact_path = ensure_artifact(lexicon_path, artifact_path)
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+        self.pool = multiprocessing.Pool(self.num_workers, init_worker, (artifact_path,))
+
+    # the k best moves for rack on board, best first
+    def generate_moves(self, board, rack, k=1, prune=False):
+        lines = board.anchor_lines()
+        if not lines or k <= 0:
+            return []
+
+        # deal the lines out in turn so every worker gets rows and columns from across the board
+        num_groups = min(self.num_workers, len(lines))
+        groups = [lines[i::num_groups] for i in range(num_groups)]
+        board_state = pickle.dumps(board)
+        results = self.pool.starmap(_generate_moves, [(board_state, rack, k, prune, group) for group in groups])
+
+        moves = [move for group_moves in results for move in group_moves]
+        return sorted(moves, reverse=True)[:k]
+
+    # the parallel counterpart of ScrabbleBoard.get_best_move
+    def get_best_move(self, board, word_rack, prune=False):
+        moves = self.generate_moves(board, word_rack, 1, prune)
+        return board.play_move(moves[0] if moves else None, word_rack)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
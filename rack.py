@@ -0,0 +1,13 @@
+# A rack is a list of 27 tile counts: one slot per letter A-Z followed by one for blanks ("%").
+# The move generators take a tile by decrementing its slot and put it back on backtrack, so
+# exploring an edge never copies the rack.
+BLANK = 26
+RACK_INDEX = {chr(65 + i): i for i in range(26)}
+RACK_INDEX["%"] = BLANK
+
+
+def rack_counts(letters):
+    rack = [0] * 27
+    for letter in letters:
+        rack[RACK_INDEX[letter]] += 1
+    return rack
@@ -0,0 +1,221 @@
+import concurrent.futures
+import threading
+import time
+
+from board import ScrabbleBoard, BoardParams
+from endgame import EndgameSolver
+
+
+RACK_SIZE = 7
+
+
+def refill_word_rack(rack, tile_bag):
+    to_add = min([RACK_SIZE - len(rack), len(tile_bag)])
+    new_letters = tile_bag[:to_add]
+    rack = rack + new_letters
+    return rack, new_letters
+
+
+def parse_tests_file(file_path):
+    with open(file_path, 'r') as file:
+        file_content = file.read()
+        return file_content
+
+
+def parse_board_and_letters(test_case):
+    lines = test_case.strip().split('\n')
+    ordered_letters = lines[0]
+    board_definition = "\n".join(lines[1:])
+    return ordered_letters, board_definition
+
+
+def parse_test_cases(content):
+    test_cases = content.strip().split('\n\n')
+    parsed_test_cases = []
+
+    for test_case in test_cases:
+        lines = test_case.strip().split('\n', 1)
+        test_number = int(lines[0].strip().strip(':'))
+        ordered_letters, board_definition = parse_board_and_letters(lines[1])
+        parsed_test_cases.append((test_number, ordered_letters, board_definition))
+
+    return parsed_test_cases
+
+
+# one turn of a session: the rack it started with, the move played or None, whether the rack was then
+# exchanged for a new one, and the seconds the move search took
+# completed is False when the search for the move was cut short by the session's move_time
+class Turn:
+    def __init__(self, rack, move, exchanged, seconds, completed=True):
+        self.rack = rack
+        self.move = move
+        self.exchanged = exchanged
+        self.seconds = seconds
+        self.completed = completed
+
+    @property
+    def score(self):
+        return self.move.score if self.move else 0
+
+    # the tiles kept on the rack after the move, None if there was no move
+    @property
+    def leave(self):
+        if self.move is None:
+            return None
+        leave = list(self.rack)
+        for tile in self.move.tiles:
+            leave.remove(tile)
+        return leave
+
+
+# receives the events of a GameSession. Override the ones you need.
+class SessionObserver:
+    def on_turn(self, session, turn):
+        pass
+
+    def on_game_over(self, session):
+        pass
+
+
+# a game of the solver against a fixed tile order, with no display. The session draws the racks from the bag,
+# plays the best move each turn and refills the rack. A turn that finds no play exchanges the whole rack for
+# new tiles while the bag holds a full rack, and otherwise ends the game.
+class GameSession:
+    # with endgame_time, moves are chosen by an EndgameSolver given that many seconds once the bag is empty. It
+    # searches a copy of the board and keeps its table from one turn of the endgame to the next.
+    # With move_time, the other searches play the best move they found in that many seconds. A search that has
+    # found none by then goes on until it finds one, so only a position without a play exchanges or ends the game.
+    def __init__(self, root, board_params, ordered_letters, observers=(), position_cache=None, leave_values=None,
+                 endgame_time=None, move_time=None):
+        if not isinstance(board_params, BoardParams):
+            board_params = BoardParams(board_params)
+        self.board_params = board_params
+        self.game = ScrabbleBoard(root, board_params, position_cache, leave_values)
+        self.tile_bag = list(ordered_letters.upper())
+        self.word_rack = self.tile_bag[:RACK_SIZE]
+        del self.tile_bag[:RACK_SIZE]
+        self.observers = list(observers)
+        self.turns = []
+        self.over = False
+        self.endgame_time = endgame_time
+        self.endgame_solver = EndgameSolver(self.game) if endgame_time is not None else None
+        self.move_time = move_time
+
+    @property
+    def score(self):
+        return sum(turn.score for turn in self.turns)
+
+    @property
+    def num_moves(self):
+        return sum(turn.move is not None for turn in self.turns)
+
+    # play one turn and return it, None once the game is over
+    def play_turn(self, prune=False):
+        if self.over:
+            return None
+        return self.play_found_move(*self.find_move(prune))
+
+    # the best move for the current rack, None if there is none, the seconds the search took and whether it
+    # completed. Only reads the session, so it can run on another thread while the session is drawn. The search
+    # stops early, with the best move found so far, after move_time or once cancel (a threading.Event) is set.
+    def find_move(self, prune=False, cancel=None):
+        start = time.perf_counter()
+        if self.endgame_solver is not None and not self.tile_bag:
+            result = self.endgame_solver.solve([self.word_rack], self.endgame_time, cancel=cancel)
+            # out of time, the solver still returns the highest scoring move, so it only has none without
+            # finishing when there is none or it was cancelled
+            cancelled = cancel is not None and cancel.is_set()
+            return result.move, time.perf_counter() - start, result.exact or result.move is None and not cancelled
+        if self.move_time is None and cancel is None:
+            moves = self.game.generate_moves(self.word_rack, k=1, prune=prune)
+            completed = True
+        else:
+            moves, completed = self.game.search_best_moves(self.word_rack, 1, self.move_time, cancel, prune,
+                                                           require_move=True)
+        return (moves[0] if moves else None), time.perf_counter() - start, completed
+
+    # play a move returned by find_move as the next turn and return the turn. A search cancelled before it found
+    # a move says nothing about the position, so it can't be played.
+    def play_found_move(self, move, seconds=0.0, completed=True):
+        if move is None and not completed:
+            raise ValueError("The search was cancelled before it found a move")
+        rack = list(self.word_rack)
+        self.word_rack = self.game.play_move(move, self.word_rack)
+        self._refill()
+
+        exchanged = False
+        if move is None:
+            if len(self.tile_bag) >= RACK_SIZE:
+                self.word_rack = []
+                self._refill()
+                exchanged = True
+            else:
+                self.over = True
+
+        turn = Turn(rack, move, exchanged, seconds, completed)
+        self.turns.append(turn)
+        for observer in self.observers:
+            observer.on_turn(self, turn)
+        if self.over:
+            for observer in self.observers:
+                observer.on_game_over(self)
+        return turn
+
+    # play turns until the game is over and return the final score
+    def play(self, prune=False):
+        while not self.over:
+            self.play_turn(prune)
+        return self.score
+
+    def _refill(self):
+        self.word_rack, new_letters = refill_word_rack(self.word_rack, self.tile_bag)
+        del self.tile_bag[:len(new_letters)]
+
+
+# plays a session with the move searches on a background thread, so the caller, such as the pygame loop, keeps
+# running while they take place. Call poll() regularly: it starts the search for the next turn and plays the
+# move once the search is done. Starting another session or shutting down cancels the search in flight, which
+# stops within a few milliseconds and whose move is dropped.
+class BackgroundPlayer:
+    def __init__(self, session=None, prune=False):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.prune = prune
+        self.session = None
+        self.future = None
+        self.cancel_event = None
+        if session is not None:
+            self.start(session)
+
+    # true while a search for the current session is in flight
+    @property
+    def thinking(self):
+        return self.future is not None
+
+    def start(self, session):
+        self.cancel()
+        self.session = session
+
+    # play the next turn if its search is done and return it, otherwise return None and start the search if
+    # it isn't running yet
+    def poll(self):
+        if self.session is None or self.session.over:
+            return None
+        if self.future is None:
+            self.cancel_event = threading.Event()
+            self.future = self.executor.submit(self.session.find_move, self.prune, self.cancel_event)
+            return None
+        if not self.future.done():
+            return None
+        found = self.future.result()
+        self.future = None
+        return self.session.play_found_move(*found)
+
+    def cancel(self):
+        if self.future is not None:
+            self.cancel_event.set()
+            self.future.cancel()
+            self.future = None
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,163 @@
+import multiprocessing
+import pickle
+import random
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+from dawg import ensure_artifact, init_worker, worker_root
+from session import RACK_SIZE
+
+
+# the board of the last position this worker process was sent, by the name of the shared memory block it was
+# read from, which the following tasks for that position reuse
+_worker_board_name = None
+_worker_board = None
+
+
+# the tasks only name the block holding the pickled board, which each worker reads once per position
+def _run_rollouts(board_name, board_size, move, rack, unseen, plies, seed, num_rollouts):
+    global _worker_board_name, _worker_board
+    if board_name != _worker_board_name:
+        block = shared_memory.SharedMemory(board_name)
+        try:
+            _worker_board = pickle.loads(bytes(block.buf[:board_size]))
+        finally:
+            block.close()
+        _worker_board.dawg_root = worker_root()
+        _worker_board_name = board_name
+    return run_rollouts(_worker_board, move, rack, unseen, plies, seed, num_rollouts)
+
+
+def _draw(tile_bag, rack):
+    num_tiles = RACK_SIZE - len(rack)
+    rack += tile_bag[:num_tiles]
+    del tile_bag[:num_tiles]
+
+
+# play move from rack and then plies more greedy turns, starting with the opponent's, num_rollouts times. Each
+# rollout shuffles the unseen tiles, deals the opponent's rack from them and refills ours. Returns the sum over
+# the rollouts of move's score plus our later scores minus the opponent's. A player who finds no play passes.
+# The board is left as it was. With the same seed, every move is played out against the same opponent racks.
+def run_rollouts(board, move, rack, unseen, plies, seed, num_rollouts):
+    rng = random.Random(seed)
+    rack_left = list(rack)
+    for tile in move.tiles:
+        rack_left.remove(tile)
+
+    total = 0
+    for _ in range(num_rollouts):
+        tile_bag = list(unseen)
+        rng.shuffle(tile_bag)
+        racks = [list(rack_left), []]
+        _draw(tile_bag, racks[1])
+        _draw(tile_bag, racks[0])
+
+        deltas = [board.make_move(move)]
+        equity = move.score
+        player = 1
+        for ply in range(plies):
+            moves = board.generate_moves(racks[player], 1)
+            if moves:
+                reply = moves[0]
+                deltas.append(board.make_move(reply))
+                equity += -reply.score if player else reply.score
+                for tile in reply.tiles:
+                    racks[player].remove(tile)
+                _draw(tile_bag, racks[player])
+            player = 1 - player
+
+        for delta in reversed(deltas):
+            board.unmake_move(delta)
+        total += equity
+    return total
+
+
+# the outcome of a simulation: the chosen move, every candidate as (move, mean equity, rollouts), best first,
+# and the number of rollouts and seconds it took
+class SimulationResult:
+    def __init__(self, move, candidates, num_rollouts, seconds):
+        self.move = move
+        self.candidates = candidates
+        self.num_rollouts = num_rollouts
+        self.seconds = seconds
+
+    @property
+    def rollouts_per_second(self):
+        return self.num_rollouts / self.seconds if self.seconds else 0.0
+
+
+# chooses moves by simulation: the k best moves by score are each played out over random continuations and the
+# one with the highest mean equity wins. Rollouts run in rounds of batch_size per candidate until the time
+# budget is spent, so every candidate gets the same number. All candidates of a round share its seed, so they
+# are compared on the same draws rather than each on its own. With num_workers=0 they run in this process,
+# otherwise across a pool whose workers map the compiled DAWG artifact and read each position once from shared
+# memory.
+class MonteCarloSimulator:
+    def __init__(self, lexicon_path, num_workers=None, artifact_path=None):
+        artifact_path = ensure_artifact(lexicon_path, artifact_path)
+        self.pool = None
+        if num_workers != 0:
+            # the workers share this process's tracker of the shared memory blocks sent to them, rather than each
+            # starting one that takes the blocks they read for leaks
+            resource_tracker.ensure_running()
+            self.pool = multiprocessing.Pool(num_workers, init_worker, (artifact_path,))
+
+    # simulate the k best moves of word_rack on board, with the tiles in unseen (not on the board or the rack)
+    # making up the bag and the opponent's rack. Stops starting rounds after time_budget seconds, or after
+    # max_rounds rounds when given.
+    def simulate(self, board, word_rack, unseen, k=10, plies=2, time_budget=1.0, batch_size=4, max_rounds=None,
+                 seed=0):
+        start = time.perf_counter()
+        candidates = board.generate_moves(word_rack, k)
+        if len(candidates) < 2 or plies <= 0:
+            move = candidates[0] if candidates else None
+            return SimulationResult(move, [(move, float(move.score), 0) for move in candidates], 0,
+                                    time.perf_counter() - start)
+
+        totals = [0] * len(candidates)
+        block = None
+        if self.pool:
+            board_state = pickle.dumps(board)
+            block = shared_memory.SharedMemory(create=True, size=len(board_state))
+            block.buf[:len(board_state)] = board_state
+        num_rounds = 0
+        try:
+            while num_rounds == 0 or time.perf_counter() - start < time_budget and \
+                    (max_rounds is None or num_rounds < max_rounds):
+                round_seed = f"{seed} {num_rounds}"
+                if self.pool:
+                    results = self.pool.starmap(_run_rollouts, [
+                        (block.name, len(board_state), move, word_rack, unseen, plies, round_seed, batch_size)
+                        for move in candidates])
+                else:
+                    results = [run_rollouts(board, move, word_rack, unseen, plies, round_seed, batch_size)
+                               for move in candidates]
+                for i, result in enumerate(results):
+                    totals[i] += result
+                num_rounds += 1
+        finally:
+            if block is not None:
+                block.close()
+                block.unlink()
+
+        num_rollouts = num_rounds * batch_size
+        # candidates come best first, so equal equities keep the order of their scores
+        ranked = sorted(zip(candidates, totals), key=lambda candidate: -candidate[1])
+        return SimulationResult(ranked[0][0], [(move, total / num_rollouts, num_rollouts) for move, total in ranked],
+                                num_rollouts * len(candidates), time.perf_counter() - start)
+
+    # the simulated counterpart of ScrabbleBoard.get_best_move
+    def get_best_move(self, board, word_rack, unseen, **options):
+        result = self.simulate(board, word_rack, unseen, **options)
+        return board.play_move(result.move, word_rack)
+
+    def close(self):
+        if self.pool:
+            self.pool.close()
+            self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()